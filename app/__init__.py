@@ -1,38 +1,171 @@
 import os
 from flask import Flask
 from flask_login import LoginManager
-from app.models import db, User
+from app.models import db as models_db
 from dotenv import load_dotenv
 
 load_dotenv()
 
 login_manager = LoginManager()
 
-def create_app():
-    app = Flask(__name__, template_folder='templates', instance_relative_config=True)
-    
+def database_uri():
     # Build database URI from environment variables
     db_user = os.getenv('DB_USER', 'postgres')
     db_password = os.getenv('DB_PASSWORD', 'postgres')
     db_host = os.getenv('DB_HOST', 'localhost')
     db_port = os.getenv('DB_PORT', '5432')
     db_name = os.getenv('DB_NAME', 'library')
+    return f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+
+def replica_database_uri():
+    # Read replica: same credentials as the primary unless DB_REPLICA_* overrides them
+    db_host = os.getenv('DB_REPLICA_HOST')
+    if not db_host:
+        return None
+    db_user = os.getenv('DB_REPLICA_USER', os.getenv('DB_USER', 'postgres'))
+    db_password = os.getenv('DB_REPLICA_PASSWORD', os.getenv('DB_PASSWORD', 'postgres'))
+    db_port = os.getenv('DB_REPLICA_PORT', os.getenv('DB_PORT', '5432'))
+    db_name = os.getenv('DB_REPLICA_NAME', os.getenv('DB_NAME', 'library'))
+    return f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+
+def create_app(prefork=False):
+    """Создать приложение.
+
+    prefork=True - приложение загружается в мастер-процессе gunicorn до fork:
+    соединения с БД и фоновые задачи поднимает init_worker() в каждом воркере.
+    """
+    app = Flask(__name__, template_folder='templates', instance_relative_config=True)
     
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+    # database - поиск в PostgreSQL, python - прежний поиск в памяти
+    app.config['SEARCH_BACKEND'] = os.getenv('SEARCH_BACKEND', 'database')
+    # Размер страницы для /library, /management и /api/v1/books
+    app.config['PAGE_SIZE'] = int(os.getenv('PAGE_SIZE', '50'))
+    app.config['MAX_PAGE_SIZE'] = int(os.getenv('MAX_PAGE_SIZE', '500'))
+    # Кэш каталога в памяти воркера: число записей (0 - без кэша) и как часто, в секундах,
+    # сверять версию каталога в БД, чтобы увидеть изменения из других воркеров
+    app.config['CATALOG_CACHE_SIZE'] = int(os.getenv('CATALOG_CACHE_SIZE', '512'))
+    app.config['CATALOG_CACHE_POLL_INTERVAL'] = float(os.getenv('CATALOG_CACHE_POLL_INTERVAL', '1'))
+    # Отмена просроченных броней в фоне: период в секундах (0 - выключено), размер и число пакетов за запуск
+    app.config['EXPIRY_SWEEP_INTERVAL'] = int(os.getenv('EXPIRY_SWEEP_INTERVAL', '300'))
+    app.config['EXPIRY_SWEEP_BATCH_SIZE'] = int(os.getenv('EXPIRY_SWEEP_BATCH_SIZE', '500'))
+    app.config['EXPIRY_SWEEP_MAX_BATCHES'] = int(os.getenv('EXPIRY_SWEEP_MAX_BATCHES', '20'))
+    # Кэш Google Books: в памяти (LRU) и на диске (SQLite, пустой путь - без диска)
+    app.config['GOOGLE_BOOKS_CACHE_TTL'] = int(os.getenv('GOOGLE_BOOKS_CACHE_TTL', '86400'))
+    app.config['GOOGLE_BOOKS_NEGATIVE_TTL'] = int(os.getenv('GOOGLE_BOOKS_NEGATIVE_TTL', '3600'))
+    app.config['GOOGLE_BOOKS_CACHE_SIZE'] = int(os.getenv('GOOGLE_BOOKS_CACHE_SIZE', '1024'))
+    app.config['GOOGLE_BOOKS_CACHE_PATH'] = os.getenv('GOOGLE_BOOKS_CACHE_PATH')
+    # Как часто, в секундах, удалять истёкшие записи дискового кэша (0 - не удалять)
+    app.config['GOOGLE_BOOKS_CACHE_PURGE_INTERVAL'] = int(os.getenv('GOOGLE_BOOKS_CACHE_PURGE_INTERVAL', '3600'))
+    # HTTP-клиент Google Books: адрес API (можно направить на локальную заглушку), пул, таймаут, повторы
+    app.config['GOOGLE_BOOKS_API_URL'] = os.getenv('GOOGLE_BOOKS_API_URL', 'https://www.googleapis.com/books/v1/volumes')
+    app.config['GOOGLE_BOOKS_POOL_SIZE'] = int(os.getenv('GOOGLE_BOOKS_POOL_SIZE', '10'))
+    app.config['GOOGLE_BOOKS_TIMEOUT'] = float(os.getenv('GOOGLE_BOOKS_TIMEOUT', '10'))
+    app.config['GOOGLE_BOOKS_RETRIES'] = int(os.getenv('GOOGLE_BOOKS_RETRIES', '3'))
+    app.config['GOOGLE_BOOKS_BACKOFF'] = float(os.getenv('GOOGLE_BOOKS_BACKOFF', '0.5'))
+    # Circuit breaker: ошибок подряд до размыкания и время до пробного запроса (сек)
+    app.config['GOOGLE_BOOKS_BREAKER_THRESHOLD'] = int(os.getenv('GOOGLE_BOOKS_BREAKER_THRESHOLD', '5'))
+    app.config['GOOGLE_BOOKS_BREAKER_RESET'] = int(os.getenv('GOOGLE_BOOKS_BREAKER_RESET', '30'))
+    # Массовый импорт по ISBN: параллельных запросов к Google Books и книг в одной транзакции
+    app.config['IMPORT_WORKERS'] = int(os.getenv('IMPORT_WORKERS', '8'))
+    app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', '100'))
+    # Максимум книг в одном запросе POST /api/v1/books:batch
+    app.config['BATCH_MAX_ROWS'] = int(os.getenv('BATCH_MAX_ROWS', '5000'))
+    # Строк за одно чтение серверного курсора при выгрузке истории
+    app.config['EXPORT_CHUNK_SIZE'] = int(os.getenv('EXPORT_CHUNK_SIZE', '1000'))
+    # Сколько последних возвратов показывать в личном кабинете
+    app.config['PROFILE_HISTORY_LIMIT'] = int(os.getenv('PROFILE_HISTORY_LIMIT', '10'))
+    # Время жизни кэша статистики библиотеки в секундах (0 - считать при каждом запросе)
+    app.config['STATS_CACHE_TTL'] = int(os.getenv('STATS_CACHE_TTL', '30'))
+    # Пул соединений с БД на процесс: постоянные соединения, сверх них, ожидание свободного (с),
+    # пересоздание соединения через N секунд, проверка соединения перед выдачей
+    app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', '5'))
+    app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    app.config['DB_POOL_TIMEOUT'] = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+    app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    app.config['DB_POOL_PRE_PING'] = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+    # Подключение через pgbouncer в режиме пулинга транзакций: без своего пула и состояния сессии
+    app.config['DB_PGBOUNCER'] = os.getenv('DB_PGBOUNCER', '0') == '1'
+    # Ограничение времени SQL-запроса в HTTP-запросе, миллисекунды (0 - без ограничения)
+    app.config['DB_STATEMENT_TIMEOUT'] = int(os.getenv('DB_STATEMENT_TIMEOUT', '0'))
+    from app.db.engine import engine_options
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    # Реплика для чтения (DB_REPLICA_HOST, пусто - всё на основной базе): допустимое отставание (с),
+    # период его проверки (с), сколько секунд после записи клиент читает с основной базы
+    app.config['DB_REPLICA_MAX_LAG'] = float(os.getenv('DB_REPLICA_MAX_LAG', '5'))
+    app.config['DB_REPLICA_CHECK_INTERVAL'] = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', '2'))
+    app.config['DB_REPLICA_STICKY'] = float(os.getenv('DB_REPLICA_STICKY', '5'))
+    replica_uri = replica_database_uri()
+    if replica_uri:
+        app.config['SQLALCHEMY_BINDS'] = {'replica': {'url': replica_uri, **engine_options(app.config)}}
+    # Сколько готовых JSON-ответов (по ETag) держать в памяти процесса
+    app.config['API_RESPONSE_CACHE_SIZE'] = int(os.getenv('API_RESPONSE_CACHE_SIZE', '256'))
+    # Кэш пользователей для Flask-Login: время жизни записи в секундах (0 - без кэша) и размер;
+    # TTL - максимальная задержка, с которой другие воркеры увидят блокировку или смену роли
+    app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', '5'))
+    app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', '1024'))
+    # Параметры хэширования паролей (формат werkzeug: scrypt:N:r:p или pbkdf2:sha256:итерации);
+    # старые хэши пересчитываются при следующем входе пользователя
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    # Проверка паролей в отдельном пуле: потоков (0 - в потоке запроса) и сколько входов может ждать
+    app.config['PASSWORD_VERIFY_WORKERS'] = int(os.getenv('PASSWORD_VERIFY_WORKERS', '0'))
+    app.config['PASSWORD_VERIFY_QUEUE'] = int(os.getenv('PASSWORD_VERIFY_QUEUE', '16'))
+    # Массовая регистрация читателей: записей в одной транзакции и потоков хэширования паролей
+    # (не больше числа ядер: импорт не должен отнимать все ядра у входов и запросов)
+    app.config['READER_IMPORT_BATCH_SIZE'] = int(os.getenv('READER_IMPORT_BATCH_SIZE', '500'))
+    app.config['READER_IMPORT_HASH_WORKERS'] = int(os.getenv('READER_IMPORT_HASH_WORKERS', '2'))
+    # Максимум SQL-запросов на HTTP-запрос (0 - проверка выключена), для тестов и CI
+    app.config['SQL_QUERY_BUDGET'] = int(os.getenv('SQL_QUERY_BUDGET', '0'))
+    # Проверка версии схемы при старте: error - не запускаться, warn - только предупредить, off
+    app.config['SCHEMA_CHECK'] = os.getenv('SCHEMA_CHECK', 'error')
     
-    db.init_app(app)
+    models_db.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'login'
+
+    from app.db.query_counter import init_query_budget
+    init_query_budget(app)
+
+    from app.db.routing import init_read_your_writes
+    init_read_your_writes(app)
     
-    with app.app_context():
-        db.create_all()
+    if app.config['SCHEMA_CHECK'] != 'off':
+        from app.db.migrate import check_schema, SchemaOutdated
+        with app.app_context():
+            try:
+                check_schema(models_db.engine)
+            except SchemaOutdated as e:
+                if app.config['SCHEMA_CHECK'] == 'error':
+                    raise
+                app.logger.warning(str(e))
+            if prefork:
+                # Мастер не обслуживает запросы - не держим в нём соединений
+                models_db.engine.dispose()
     
     from app.api.routes import register_routes
     register_routes(app)
+
+    from app.cli import register_commands
+    register_commands(app)
+
+    if not prefork:
+        from app.services.scheduler import start_on_first_request
+        start_on_first_request(app)
     
     return app
 
+def init_worker(app):
+    """Вызывается в воркере сразу после fork: пул соединений, унаследованный от мастера,
+    отбрасывается без закрытия чужих сокетов, фоновые задачи запускаются в самом воркере"""
+    with app.app_context():
+        for engine in models_db.engines.values():
+            engine.dispose(close=False)
+
+    from app.services.scheduler import start_background_jobs
+    start_background_jobs(app)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
\ No newline at end of file
+    from app.services import user_service
+    return user_service.load_user(user_id)
\ No newline at end of file
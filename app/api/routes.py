@@ -1,8 +1,13 @@
-from flask import jsonify, request, render_template, redirect, url_for, flash, session
+import hashlib
+import json
+from flask import jsonify, request, render_template, redirect, url_for, flash, session, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from functools import wraps
 from app.models import db, User
-from app.services import library_service, google_books_service, user_service
+from app.cache import TTLCache
+from app.services import library_service, google_books_service, user_service, import_service, export_service
+from app.db.engine import pool_stats
+from app.db.routing import REPLICA_BIND, primary, routing_stats
 
 def admin_required(f):
     @wraps(f)
@@ -21,6 +26,32 @@ def admin_api_required(f):
     return decorated_function
 
 def register_routes(app):
+    # Готовые тела JSON-ответов по ETag: версия данных в ключе, поэтому устаревших записей не бывает
+    response_cache = TTLCache(maxsize=app.config.get('API_RESPONSE_CACHE_SIZE', 256), ttl=3600)
+
+    def versioned_json(scopes, build):
+        """Ответ с ETag по версиям всех scopes, от которых зависит тело: на совпавший
+        If-None-Match - 304 без обращения к ORM, иначе тело из кэша или build().
+
+        build() читает с основной базы, как и версия: тело с отстающей реплики
+        осталось бы в кэше и у клиента под ETag более новой версии.
+        """
+        versions = library_service.get_data_versions(scopes)
+        key = ':'.join(f"{scope}:{version}" for scope, version in versions.items())
+        etag = hashlib.sha1(f"{key}:{request.full_path}".encode()).hexdigest()[:20]
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            body = response_cache.get(etag)
+            if body is None:
+                with primary():
+                    body = app.json.dumps(build()).encode()
+                response_cache.set(etag, body)
+            response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
     @app.route('/')
     def index():
         return render_template('index.html')
@@ -64,9 +95,13 @@ def register_routes(app):
             email = request.form.get('email')
             password = request.form.get('password')
             
-            user = User.query.filter_by(email=email).first()
+            try:
+                user = user_service.authenticate(email, password)
+            except user_service.PasswordCheckBusy:
+                flash('Сервер перегружен, попробуйте войти через несколько секунд', 'error')
+                return render_template('login.html'), 503
             
-            if not user or not user.check_password(password):
+            if not user:
                 flash('Неверный email или пароль', 'error')
                 return render_template('login.html')
             
@@ -87,7 +122,8 @@ def register_routes(app):
         profile_data = library_service.prepare_profile_data(current_user.id)
         return render_template('profile.html',
                              active_borrows=profile_data['active_borrows'],
-                             history=profile_data['returned_records'])
+                             history=profile_data['returned_records'],
+                             stats=profile_data['stats'])
 
     @app.route('/search')
     def search_page():
@@ -127,20 +163,22 @@ def register_routes(app):
     @app.route('/library')
     @login_required
     def library_page():
-        all_books = library_service.get_books()
         query = request.args.get('query', '')
         status_filter = request.args.get('status', 'all')
+        after = request.args.get('after') or None
         
-        books = library_service.search_books(query, status_filter)
-        stats = library_service.get_library_stats(all_books)
+        page = library_service.search_books_page(query, status_filter, after=after)
+        stats = library_service.get_library_stats()
         
         return render_template('library.html',
-                             total_books=stats['total'],
+                             total_books=stats['total_titles'],
                              query=query,
                              status_filter=status_filter,
-                             result_count=len(books),
-                             available_books=stats['available'],
-                             books=books)
+                             result_count=len(page['items']),
+                             available_books=stats['available_titles'],
+                             books=page['items'],
+                             after=after,
+                             next_cursor=page['next_cursor'])
 
     @app.route('/add-book', methods=['GET', 'POST'])
     @login_required
@@ -185,8 +223,7 @@ def register_routes(app):
     @login_required
     @admin_required
     def issue_book_confirm(isbn):
-        all_books = library_service.get_books()
-        book = next((b for b in all_books if b['isbn'] == isbn), None)
+        book = library_service.get_book(isbn)
         if not book:
             flash('Книга не найдена', 'error')
             return redirect(url_for('issue_book_page'))
@@ -269,8 +306,7 @@ def register_routes(app):
     @login_required
     @admin_required
     def reserve_book_confirm(isbn):
-        all_books = library_service.get_books()
-        book = next((b for b in all_books if b['isbn'] == isbn), None)
+        book = library_service.get_book(isbn)
         if not book:
             flash('Книга не найдена', 'error')
             return redirect(url_for('reserve_book_page'))
@@ -323,8 +359,7 @@ def register_routes(app):
     @login_required
     @admin_required
     def edit_book_page(isbn):
-        all_books = library_service.get_books()
-        book = next((b for b in all_books if b['isbn'] == isbn), None)
+        book = library_service.get_book(isbn)
         if not book:
             flash('Книга не найдена', 'error')
             return redirect(url_for('management_page'))
@@ -426,10 +461,13 @@ def register_routes(app):
         status_filter = request.args.get('status', 'all')
         user_email = request.args.get('user_email', '')
         user_ticket = request.args.get('user_ticket', '')
+        cursor = request.args.get('cursor') or None
+        next_cursor = None
         
         try:
-            all_records = library_service.get_all_records()
-            records = library_service.filter_records(all_records, status_filter, user_email, user_ticket)
+            page = library_service.get_records_page(cursor, None, status_filter, user_email, user_ticket)
+            next_cursor = page['next_cursor']
+            records = page['items']
         except Exception as e:
             records = []
             flash(str(e), 'error')
@@ -438,14 +476,33 @@ def register_routes(app):
                              status_filter=status_filter,
                              user_email=user_email,
                              user_ticket=user_ticket,
-                             records=records)
+                             records=records,
+                             cursor=cursor,
+                             next_cursor=next_cursor)
 
     # API endpoints
     @app.route('/api/v1/books', methods=['GET'])
     @login_required
     @admin_api_required
     def get_books():
-        return jsonify({'books': library_service.get_books()}), 200
+        def build():
+            page = library_service.search_books_page(
+                query=request.args.get('query', ''),
+                status_filter=request.args.get('status', 'all'),
+                after=request.args.get('after') or None,
+                limit=request.args.get('limit', type=int),
+                count=request.args.get('count')
+            )
+            response = {'books': page['items'], 'next_cursor': page['next_cursor']}
+            if 'total' in page:
+                response['total'] = page['total']
+                response['total_estimated'] = page.get('total_estimated', False)
+            return response
+
+        try:
+            return versioned_json([library_service.CATALOG_SCOPE], build)
+        except library_service.LibraryError as e:
+            return jsonify({'error': str(e)}), 400
 
     @app.route('/api/v1/books', methods=['POST'])
     @login_required
@@ -467,6 +524,22 @@ def register_routes(app):
         except Exception:
             return jsonify({'error': 'Server error'}), 500
 
+    @app.route('/api/v1/books:batch', methods=['POST'])
+    @login_required
+    @admin_api_required
+    def save_books_batch():
+        try:
+            data = request.get_json()
+            rows = data.get('books', []) if isinstance(data, dict) else data
+            if not isinstance(rows, list) or not rows:
+                return jsonify({'error': 'A non-empty list of books is required'}), 400
+            result = library_service.save_books(rows)
+            return jsonify(result), 200
+        except library_service.LibraryError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception:
+            return jsonify({'error': 'Server error'}), 500
+
     @app.route('/api/v1/books/<isbn>', methods=['PUT'])
     @login_required
     @admin_api_required
@@ -500,16 +573,27 @@ def register_routes(app):
         except Exception:
             return jsonify({'error': 'Server error'}), 500
 
+    @app.route('/api/v1/stats', methods=['GET'])
+    @login_required
+    def get_library_stats():
+        return jsonify(library_service.get_library_stats()), 200
+
     @app.route('/api/v1/borrow-history', methods=['GET'])
     @login_required
     def get_borrow_history():
         try:
             isbn = request.args.get('isbn')
             user_id = request.args.get('user_id')
+            # Scope версии строится из user_id: '05' и '5' должны давать один ключ
+            if user_id:
+                try:
+                    user_id = int(user_id)
+                except ValueError:
+                    return jsonify({'error': 'user_id must be an integer'}), 400
             
             # Обычный пользователь может видеть только свою историю
             if not current_user.is_admin():
-                if user_id and int(user_id) != current_user.id:
+                if user_id and user_id != current_user.id:
                     return jsonify({'error': 'Forbidden'}), 403
                 user_id = current_user.id
             else:
@@ -517,8 +601,11 @@ def register_routes(app):
                 if not user_id:
                     user_id = current_user.id
             
-            history = library_service.get_borrow_history(isbn, user_id)
-            return jsonify({'history': history}), 200
+            # В записях есть названия книг: правка каталога тоже меняет ответ
+            return versioned_json(
+                [library_service.user_scope(user_id), library_service.CATALOG_SCOPE],
+                lambda: {'history': library_service.get_borrow_history(isbn, user_id)}
+            )
         except Exception:
             return jsonify({'error': 'Server error'}), 500
 
@@ -527,10 +614,15 @@ def register_routes(app):
     def get_active_borrows():
         try:
             user_id = request.args.get('user_id')
+            if user_id:
+                try:
+                    user_id = int(user_id)
+                except ValueError:
+                    return jsonify({'error': 'user_id must be an integer'}), 400
             
             # Обычный пользователь может видеть только свои данные
             if not current_user.is_admin():
-                if user_id and int(user_id) != current_user.id:
+                if user_id and user_id != current_user.id:
                     return jsonify({'error': 'Forbidden'}), 403
                 user_id = current_user.id
             else:
@@ -538,8 +630,11 @@ def register_routes(app):
                 if not user_id:
                     user_id = current_user.id
 
-            active_borrows = library_service.get_active_borrows(user_id)
-            return jsonify({'active_borrows': active_borrows}), 200
+            # В записях есть названия книг: правка каталога тоже меняет ответ
+            return versioned_json(
+                [library_service.user_scope(user_id), library_service.CATALOG_SCOPE],
+                lambda: {'active_borrows': library_service.get_active_borrows(user_id)}
+            )
         except Exception:
             return jsonify({'error': 'Server error'}), 500
 
@@ -556,6 +651,8 @@ def register_routes(app):
             
             books = google_books_service.search_books(query, max_results)
             return jsonify({'books': books}), 200
+        except google_books_service.GoogleBooksUnavailable as e:
+            return jsonify({'error': str(e)}), 503
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -568,9 +665,45 @@ def register_routes(app):
             if not book:
                 return jsonify({'error': 'Book not found'}), 404
             return jsonify(book), 200
+        except google_books_service.GoogleBooksUnavailable as e:
+            return jsonify({'error': str(e)}), 503
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/api/v1/search/google-books/cache', methods=['GET'])
+    @login_required
+    @admin_api_required
+    def google_books_cache_stats():
+        return jsonify(google_books_service.get_cache_stats()), 200
+
+    @app.route('/api/v1/search/google-books/cache', methods=['DELETE'])
+    @login_required
+    @admin_api_required
+    def google_books_cache_invalidate():
+        google_books_service.invalidate_cache(request.args.get('isbn'))
+        return jsonify({'message': 'Cache invalidated'}), 200
+
+    @app.route('/api/v1/cache/catalog', methods=['GET'])
+    @login_required
+    @admin_api_required
+    def catalog_cache_stats():
+        return jsonify(library_service.get_catalog_cache_stats()), 200
+
+    @app.route('/api/v1/cache/users', methods=['GET'])
+    @login_required
+    @admin_api_required
+    def user_cache_stats():
+        return jsonify(user_service.get_user_cache_stats()), 200
+
+    @app.route('/api/v1/db/pool', methods=['GET'])
+    @login_required
+    @admin_api_required
+    def db_pool_stats():
+        stats = pool_stats(db.engine)
+        if REPLICA_BIND in db.engines:
+            stats['replica'] = {**pool_stats(db.engines[REPLICA_BIND]), **routing_stats()}
+        return jsonify(stats), 200
+
     @app.route('/api/v1/import/google-books', methods=['POST'])
     @login_required
     @admin_api_required
@@ -602,3 +735,98 @@ def register_routes(app):
             return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
+
+    @app.route('/api/v1/import/google-books/batch', methods=['POST'])
+    @login_required
+    @admin_api_required
+    def import_from_google_books_batch():
+        default_copies = request.args.get('copies', 1, type=int)
+        # Форма запроса проверяется до начала потока: после заголовка 200 вернуть 400 уже нельзя
+        try:
+            if 'file' in request.files:
+                lines = request.files['file'].read().decode('utf-8').splitlines()
+                items = import_service.parse_isbn_lines(lines, default_copies)
+            else:
+                data = request.get_json(silent=True) or {}
+                if isinstance(data, list):
+                    items = import_service.normalize_items(data, default_copies)
+                elif isinstance(data, dict):
+                    items = import_service.normalize_items(
+                        data.get('items') or data.get('isbns') or [], data.get('copies', default_copies)
+                    )
+                else:
+                    raise ValueError("Body must be a JSON object or array")
+        except UnicodeDecodeError:
+            return jsonify({'error': 'ISBN list must be a UTF-8 text file'}), 400
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not items:
+            return jsonify({'error': 'No ISBNs provided'}), 400
+
+        results = import_service.import_isbns(
+            items,
+            workers=request.args.get('workers', type=int),
+            batch_size=request.args.get('batch_size', type=int)
+        )
+        lines = (json.dumps(line, ensure_ascii=False) + '\n' for line in results)
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+    @app.route('/api/v1/readers:import', methods=['POST'])
+    @login_required
+    @admin_api_required
+    def import_readers():
+        try:
+            if 'file' in request.files:
+                upload = request.files['file']
+                content = upload.read().decode('utf-8-sig')
+                if upload.filename.lower().endswith('.json'):
+                    data = json.loads(content)
+                    rows = data.get('readers') if isinstance(data, dict) else data
+                else:
+                    rows = user_service.parse_readers_csv(content)
+            elif request.mimetype == 'text/csv':
+                rows = user_service.parse_readers_csv(request.get_data(as_text=True))
+            else:
+                data = request.get_json(silent=True)
+                rows = data.get('readers') if isinstance(data, dict) else data
+        except ValueError:
+            # UnicodeDecodeError и JSONDecodeError - подклассы ValueError
+            return jsonify({'error': 'Readers must be a UTF-8 CSV file or JSON'}), 400
+        if not isinstance(rows, list) or not rows:
+            return jsonify({'error': 'No readers provided'}), 400
+
+        try:
+            result = user_service.import_readers(rows, batch_size=request.args.get('batch_size', type=int))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # В ответе временные пароли: не кэшировать
+        if request.args.get('format', 'csv') == 'json':
+            response = jsonify(result)
+        else:
+            response = Response(user_service.readers_to_csv(result['readers']), mimetype='text/csv',
+                                headers={'Content-Disposition': 'attachment; filename=readers_credentials.csv'})
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    @app.route('/api/v1/export/borrow-records', methods=['GET'])
+    @login_required
+    @admin_api_required
+    def export_borrow_records():
+        fmt = request.args.get('format', 'ndjson')
+        try:
+            chunks = export_service.export_borrow_records(
+                fmt,
+                date_from=request.args.get('date_from'),
+                date_to=request.args.get('date_to'),
+                status=request.args.get('status'),
+                user_id=request.args.get('user_id'),
+                isbn=request.args.get('isbn')
+            )
+        except export_service.ExportError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if fmt == 'csv':
+            return Response(stream_with_context(chunks), mimetype='text/csv',
+                            headers={'Content-Disposition': 'attachment; filename=borrow_records.csv'})
+        return Response(stream_with_context(chunks), mimetype='application/x-ndjson')
@@ -0,0 +1,260 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с ограничением по размеру и времени жизни записей"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+class VersionedCache:
+    """LRU-кэш, согласованный между процессами через внешний счётчик версии.
+
+    load_version() опрашивается не чаще poll_interval секунд; если версия изменилась
+    (данные поменял другой процесс), кэш сбрасывается целиком. Свои изменения процесс
+    сбрасывает сразу через clear(). Значение, загрузка которого началась до сброса,
+    в кэш не попадает.
+    """
+
+    def __init__(self, load_version, maxsize=512, poll_interval=1.0, ttl=3600):
+        self.load_version = load_version
+        self.poll_interval = poll_interval
+        self.version = None
+        self.checked_at = None
+        self.generation = 0
+        self.polls = 0
+        self.invalidations = 0
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.checked_at is not None and now - self.checked_at < self.poll_interval:
+                return
+            self.checked_at = now
+            self.polls += 1
+        version = self.load_version()
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    self._cache.clear()
+                    self.generation += 1
+                    self.invalidations += 1
+                self.version = version
+
+    def get_or_load(self, key, loader):
+        self._sync()
+        with self._lock:
+            generation = self.generation
+        value = self._cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            with self._lock:
+                if generation == self.generation:
+                    self._cache.set(key, value)
+        return value
+
+    def clear(self):
+        """Сбросить кэш после своей записи; версия перечитывается при следующем обращении"""
+        with self._lock:
+            self._cache.clear()
+            self.generation += 1
+            self.checked_at = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._cache.stats(),
+                'version': self.version,
+                'generation': self.generation,
+                'version_polls': self.polls,
+                'invalidations': self.invalidations
+            }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Объединение одновременных одинаковых вызовов: пока выполняется func для ключа,
+    остальные вызовы с тем же ключом ждут и получают тот же результат или ту же ошибку"""
+
+    def __init__(self):
+        self.executed = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            calls = self.executed + self.shared
+            return {
+                'in_flight': len(self._calls),
+                'executed': self.executed,
+                'shared': self.shared,
+                'dedupe_ratio': self.shared / calls if calls else 0.0
+            }
+
+
+class SQLiteCache:
+    """Персистентный кэш в файле SQLite: переживает перезапуск и общий для всех процессов.
+
+    Журнал WAL: читатели не ждут писателя, а одновременные записи из разных воркеров
+    ждут друг друга до busy_timeout миллисекунд, а не падают сразу с "database is locked".
+    """
+
+    def __init__(self, path, busy_timeout=5000):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # Отдельное соединение на операцию: безопасно для потоков и fork
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000)
+        try:
+            conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_with_expiry(self, key):
+        """Вернуть (значение, время истечения по time.time()) или None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, ttl):
+        self.set_many([(key, value, ttl)])
+
+    def set_many(self, entries):
+        """Записать пары (ключ, значение, ttl) одной транзакцией"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, json.dumps(value, ensure_ascii=False), now + ttl) for key, value, ttl in entries]
+            )
+
+    def invalidate(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def purge_expired(self):
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),)).rowcount
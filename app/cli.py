@@ -0,0 +1,225 @@
+import json
+import os
+import threading
+import time
+import click
+from app.models import db, Book, BorrowRecord, User
+
+
+def register_commands(app):
+    @app.cli.command('sweep-expired')
+    @click.option('--batch-size', default=None, type=int, help='Записей в одной транзакции')
+    @click.option('--max-batches', default=None, type=int, help='Ограничить число пакетов')
+    def sweep_expired(batch_size, max_batches):
+        """Отменить просроченные брони и вернуть копии в фонд"""
+        from app.services import library_service
+
+        report = library_service.cancel_expired_reservations(
+            batch_size=batch_size or app.config['EXPIRY_SWEEP_BATCH_SIZE'],
+            max_batches=max_batches
+        )
+        click.echo(f"Cancelled {report['records']} reservations, {report['books']} book updates, "
+                   f"{report['batches']} batches in {report['duration']:.3f}s")
+        if report['locked']:
+            click.echo("Stopped: another sweep is running", err=True)
+
+    @app.cli.command('import-isbns')
+    @click.argument('source', type=click.File('r', encoding='utf-8'))
+    @click.option('--copies', default=1, show_default=True, help='Экземпляров, если в строке не указано')
+    @click.option('--workers', default=None, type=int, help='Параллельных запросов к Google Books')
+    @click.option('--batch-size', default=None, type=int, help='Книг в одной транзакции')
+    def import_isbns(source, copies, workers, batch_size):
+        """Импортировать книги из Google Books по списку ISBN (строки "isbn" или "isbn,copies")"""
+        from app.services import import_service
+
+        items = import_service.parse_isbn_lines(source, copies)
+        for line in import_service.import_isbns(items, workers=workers, batch_size=batch_size):
+            click.echo(json.dumps(line, ensure_ascii=False))
+
+    @app.cli.command('import-readers')
+    @click.argument('source', type=click.File('r', encoding='utf-8-sig'))
+    @click.option('--output', type=click.File('w', encoding='utf-8'), default='-',
+                  help='CSV с билетами и временными паролями (по умолчанию stdout)')
+    @click.option('--batch-size', default=None, type=int, help='Читателей в одной транзакции')
+    def import_readers(source, output, batch_size):
+        """Зарегистрировать читателей из CSV (email,full_name) или JSON-списка"""
+        from app.services import user_service
+
+        try:
+            content = source.read()
+            if source.name.lower().endswith('.json'):
+                data = json.loads(content)
+                rows = data.get('readers') if isinstance(data, dict) else data
+            else:
+                rows = user_service.parse_readers_csv(content)
+            if not isinstance(rows, list):
+                raise ValueError("Expected a list of readers")
+            result = user_service.import_readers(rows, batch_size=batch_size)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        output.write(user_service.readers_to_csv(result['readers']))
+        click.echo(json.dumps(result['summary'], ensure_ascii=False), err=True)
+
+    @app.cli.command('export-records')
+    @click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default='ndjson', show_default=True)
+    @click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='Файл (по умолчанию stdout)')
+    @click.option('--date-from', default=None, help='Дата брони с (YYYY-MM-DD)')
+    @click.option('--date-to', default=None, help='Дата брони по (YYYY-MM-DD)')
+    @click.option('--status', default=None)
+    @click.option('--user-id', default=None, type=int)
+    @click.option('--isbn', default=None)
+    @click.option('--chunk-size', default=None, type=int, help='Строк за одно чтение из курсора')
+    def export_records(fmt, output, date_from, date_to, status, user_id, isbn, chunk_size):
+        """Выгрузить историю выдач в NDJSON или CSV потоком"""
+        from app.services import export_service
+
+        try:
+            chunks = export_service.export_borrow_records(
+                fmt, date_from=date_from, date_to=date_to, status=status,
+                user_id=user_id, isbn=isbn, chunk_size=chunk_size
+            )
+        except export_service.ExportError as e:
+            raise click.ClickException(str(e))
+        for chunk in chunks:
+            output.write(chunk)
+
+    @app.cli.command('stress-circulation')
+    @click.option('--copies', default=50, show_default=True, help='Экземпляров тестовой книги')
+    @click.option('--threads', default=16, show_default=True, help='Параллельных потоков')
+    @click.option('--attempts', default=10, show_default=True, help='Попыток брони на поток')
+    @click.option('--isbn', default='9990000000000', show_default=True, help='ISBN временной книги')
+    def stress_circulation(copies, threads, attempts, isbn):
+        """Нагрузочная проверка атомарности брони/отмены/выдачи/возврата.
+
+        Все потоки одновременно бронируют одну книгу: успешных броней должно быть
+        ровно столько, сколько было экземпляров. Затем часть броней отменяется,
+        часть выдаётся и возвращается - в фонде должно оказаться исходное число копий.
+        """
+        from app.db import db as db_module
+
+        if db.session.get(Book, isbn):
+            raise click.ClickException(f"Book {isbn} already exists, choose another --isbn")
+        user = User(email=f'stress-{isbn}@localhost', full_name='Stress test', role='user')
+        db.session.add_all([Book(isbn=isbn, title='Stress test', copies_available=copies), user])
+        db.session.commit()
+        user_id = user.id
+
+        reserved = []
+        errors = []
+        lock = threading.Lock()
+        start_barrier = threading.Barrier(threads)
+
+        def reserve_worker():
+            with app.app_context():
+                start_barrier.wait()
+                for _ in range(attempts):
+                    try:
+                        record_id = db_module.reserve_book(isbn, user_id)
+                        with lock:
+                            reserved.append(record_id)
+                    except ValueError:
+                        pass
+                    except Exception as e:
+                        with lock:
+                            errors.append(repr(e))
+
+        def release_worker(record_ids):
+            with app.app_context():
+                start_barrier.wait()
+                for index, record_id in enumerate(record_ids):
+                    try:
+                        if index % 2:
+                            db_module.cancel_reservation(record_id)
+                        else:
+                            db_module.issue_book(record_id)
+                            db_module.return_book(isbn, user_id)
+                    except Exception as e:
+                        with lock:
+                            errors.append(repr(e))
+
+        def run(workers):
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            return time.perf_counter() - started
+
+        try:
+            reserve_time = run([threading.Thread(target=reserve_worker) for _ in range(threads)])
+            db.session.expire_all()
+            copies_after_reserve = db.session.get(Book, isbn).copies_available
+
+            chunks = [reserved[i::threads] for i in range(threads)]
+            release_time = run([threading.Thread(target=release_worker, args=(chunk,)) for chunk in chunks])
+            db.session.expire_all()
+            copies_after_release = db.session.get(Book, isbn).copies_available
+            open_records = BorrowRecord.query.filter(
+                BorrowRecord.book_isbn == isbn,
+                BorrowRecord.status.in_(['reserved', 'issued'])
+            ).count()
+        finally:
+            BorrowRecord.query.filter_by(book_isbn=isbn).delete()
+            Book.query.filter_by(isbn=isbn).delete()
+            User.query.filter_by(id=user_id).delete()
+            db.session.commit()
+
+        attempted = threads * attempts
+        click.echo(f"Reserve: {len(reserved)}/{attempted} succeeded in {reserve_time:.2f}s "
+                   f"({attempted / reserve_time:.0f} req/s), copies left {copies_after_reserve}")
+        click.echo(f"Release: {len(reserved)} records in {release_time:.2f}s, "
+                   f"copies back {copies_after_release}, open records {open_records}")
+
+        failures = []
+        if errors:
+            failures.append(f"{len(errors)} unexpected errors, first: {errors[0]}")
+        if len(reserved) != min(copies, attempted):
+            failures.append(f"expected {min(copies, attempted)} reservations, got {len(reserved)}")
+        if copies_after_reserve != copies - len(reserved):
+            failures.append(f"lost update after reserve: {copies_after_reserve} copies left")
+        if copies_after_release != copies or open_records:
+            failures.append(f"lost update after release: {copies_after_release} copies, {open_records} open records")
+        if failures:
+            raise click.ClickException('; '.join(failures))
+        click.echo("OK: no oversold copies, no lost updates")
+
+    @app.cli.command('bench-passwords')
+    @click.option('--method', 'methods', multiple=True,
+                  help='Параметры хэширования (можно несколько), по умолчанию PASSWORD_HASH_METHOD')
+    @click.option('--seconds', default=3.0, show_default=True, help='Длительность замера для каждого метода')
+    @click.option('--threads', default=None, type=int, help='Параллельных проверок (по умолчанию число ядер)')
+    def bench_passwords(methods, seconds, threads):
+        """Замер проверок пароля (входов) в секунду на одно ядро и на все потоки процесса"""
+        from werkzeug.security import check_password_hash, generate_password_hash
+
+        threads = threads or os.cpu_count() or 1
+
+        def measure(password_hash, workers):
+            done = [0] * workers
+            deadline = time.perf_counter() + seconds
+
+            def worker(index):
+                while time.perf_counter() < deadline:
+                    check_password_hash(password_hash, 'benchmark-password')
+                    done[index] += 1
+
+            pool = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+            started = time.perf_counter()
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+            return sum(done) / (time.perf_counter() - started)
+
+        for method in methods or [app.config['PASSWORD_HASH_METHOD']]:
+            password_hash = generate_password_hash('benchmark-password', method)
+            single = measure(password_hash, 1)
+            parallel = measure(password_hash, threads)
+            click.echo(json.dumps({
+                'method': password_hash.split('$', 1)[0],
+                'logins_per_second_per_core': round(single, 1),
+                'ms_per_login': round(1000 / single, 2) if single else None,
+                'threads': threads,
+                'logins_per_second_threads': round(parallel, 1),
+                'thread_scaling': round(parallel / single, 2) if single else None
+            }))
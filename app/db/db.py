@@ -1,46 +1,258 @@
-from app.models import db, Book, Author, Genre, BorrowRecord
+import time
+from functools import wraps
+from app.models import db, Book, Author, Genre, BorrowRecord, User, book_authors, book_genres, data_versions
 from datetime import date, timedelta
+from sqlalchemy import delete, event, func, select, text, tuple_, union, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, contains_eager, joinedload, selectinload
+
+def _catalog_query():
+    """Books with authors and genres batch-loaded by selectinload.
+
+    selectinload sends the parent keys in IN lists of 500, so N books take
+    1 + 2 * ceil(N / 500) queries: 3 up to 500 books, not one per book.
+    """
+    return Book.query.options(selectinload(Book.authors), selectinload(Book.genres))
 
 def get_all_books():
-    return [book.to_dict() for book in Book.query.all()]
+    return [book.to_dict() for book in _catalog_query().all()]
 
-def add_book(isbn, title, copies_available, author_names=None, genre_names=None):
-    book = Book(isbn=isbn, title=title, copies_available=copies_available)
-    if author_names:
-        for name in author_names:
-            author = Author.query.filter_by(name=name).first() or Author(name=name)
-            book.authors.append(author)
-    if genre_names:
-        for name in genre_names:
-            genre = Genre.query.filter_by(name=name).first() or Genre(name=name)
-            book.genres.append(genre)
-    db.session.add(book)
+def get_book(isbn):
+    """Single book by primary key with authors and genres in one query"""
+    book = Book.query.options(
+        joinedload(Book.authors),
+        joinedload(Book.genres)
+    ).filter_by(isbn=isbn).first()
+    return book.to_dict() if book else None
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _search_filter(books, query='', status_filter='all'):
+    if query:
+        # UNION instead of OR: each branch is matched by its own trigram index
+        # (title, isbn, author name); an OR with a subquery in one arm cannot use them
+        pattern = f"%{_escape_like(query)}%"
+        matches = union(
+            select(Book.isbn).where(Book.title.ilike(pattern, escape='\\')),
+            select(Book.isbn).where(Book.isbn.ilike(pattern, escape='\\')),
+            select(book_authors.c.book_isbn).join(Author, Author.id == book_authors.c.author_id)
+            .where(Author.name.ilike(pattern, escape='\\'))
+        )
+        books = books.filter(Book.isbn.in_(matches))
+
+    if status_filter == 'available':
+        books = books.filter(Book.copies_available > 0)
+    elif status_filter == 'unavailable':
+        books = books.filter(Book.copies_available == 0)
+    return books
+
+def search_books(query='', status_filter='all', after_isbn=None, limit=None):
+    """Search books by title, ISBN or author name inside the database.
+
+    Results are ordered by ISBN; after_isbn/limit give a keyset page.
+    """
+    books = _search_filter(_catalog_query(), query, status_filter)
+    if after_isbn:
+        books = books.filter(Book.isbn > after_isbn)
+    books = books.order_by(Book.isbn)
+    if limit:
+        books = books.limit(limit)
+    return [book.to_dict() for book in books.all()]
+
+def count_books(query='', status_filter='all'):
+    return _search_filter(Book.query, query, status_filter).count()
+
+def estimate_count(table_name):
+    """Row count estimate from planner statistics, no table scan"""
+    estimate = db.session.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table_name"),
+        {'table_name': table_name}
+    ).scalar()
+    return max(estimate or 0, 0)
+
+def get_library_stats():
+    """Catalog and circulation counters from three aggregate queries"""
+    total_titles, available_titles, copies_available = db.session.query(
+        func.count(Book.isbn),
+        func.count(Book.isbn).filter(Book.copies_available > 0),
+        func.coalesce(func.sum(Book.copies_available), 0)
+    ).one()
+    copies_out, active_reservations = db.session.query(
+        func.count().filter(BorrowRecord.status == 'issued'),
+        func.count().filter(BorrowRecord.status == 'reserved')
+    ).filter(BorrowRecord.status.in_(['reserved', 'issued'])).one()
+    genres = db.session.query(Genre.name, func.count(book_genres.c.book_isbn)).outerjoin(
+        book_genres, book_genres.c.genre_id == Genre.id
+    ).group_by(Genre.id, Genre.name).order_by(func.count(book_genres.c.book_isbn).desc(), Genre.name)
+
+    return {
+        'total_titles': total_titles,
+        'available_titles': available_titles,
+        'total_copies': copies_available + copies_out + active_reservations,
+        'copies_available': copies_available,
+        'copies_out': copies_out,
+        'active_reservations': active_reservations,
+        'genres': {name: count for name, count in genres}
+    }
+
+def _resolve_names(model, names):
+    """Map author/genre names to ids for a whole batch.
+
+    One SELECT for known names, one INSERT ... ON CONFLICT (name) DO NOTHING for
+    the missing ones (names are unique since migration 0005, so concurrent batches
+    cannot create duplicates) and one SELECT to read their ids back.
+    """
+    names = set(names)
+    if not names:
+        return {}
+    ids = dict(db.session.query(model.name, model.id).filter(model.name.in_(names)))
+    missing = names - ids.keys()
+    if missing:
+        db.session.execute(pg_insert(model).on_conflict_do_nothing(index_elements=['name']),
+                           [{'name': name} for name in missing])
+        ids.update(db.session.query(model.name, model.id).filter(model.name.in_(missing)))
+    return ids
+
+def _replace_links(table, column, links):
+    """Replace association rows for the given books; links maps ISBN -> ids"""
+    if not links:
+        return
+    db.session.execute(delete(table).where(table.c.book_isbn.in_(list(links))))
+    rows = [{'book_isbn': isbn, column: id_} for isbn, ids in links.items() for id_ in dict.fromkeys(ids)]
+    db.session.execute(pg_insert(table).on_conflict_do_nothing(), rows)
+
+def save_books(books, update_existing=True):
+    """Insert, or update when update_existing, a batch of books in one transaction.
+
+    books: dicts with isbn, title, copies, authors, genres. As in update_book,
+    authors/genres of an existing book are replaced only when a non-empty list
+    is given. Without update_existing a duplicate ISBN raises IntegrityError.
+    Returns the set of ISBNs that were newly created.
+    """
+    if not books:
+        return set()
+    existing = get_existing_isbns([book['isbn'] for book in books])
+    author_ids = _resolve_names(Author, [name for book in books for name in book.get('authors') or []])
+    genre_ids = _resolve_names(Genre, [name for book in books for name in book.get('genres') or []])
+
+    statement = pg_insert(Book).values([{
+        'isbn': book['isbn'],
+        'title': book['title'],
+        'copies_available': book['copies']
+    } for book in books])
+    if update_existing:
+        statement = statement.on_conflict_do_update(
+            index_elements=[Book.isbn],
+            set_={'title': statement.excluded.title, 'copies_available': statement.excluded.copies_available}
+        )
+    db.session.execute(statement)
+
+    _replace_links(book_authors, 'author_id', {
+        book['isbn']: [author_ids[name] for name in book['authors']] for book in books if book.get('authors')
+    })
+    _replace_links(book_genres, 'genre_id', {
+        book['isbn']: [genre_ids[name] for name in book['genres']] for book in books if book.get('genres')
+    })
+    touch_scopes(CATALOG_SCOPE)
     db.session.commit()
+    return {book['isbn'] for book in books} - existing
+
+def add_book(isbn, title, copies_available, author_names=None, genre_names=None):
+    save_books([{
+        'isbn': isbn,
+        'title': title,
+        'copies': copies_available,
+        'authors': author_names,
+        'genres': genre_names
+    }], update_existing=False)
+
+def get_existing_isbns(isbns):
+    """Which of the given ISBNs are already in the catalog, in one query"""
+    if not isbns:
+        return set()
+    return {isbn for (isbn,) in db.session.query(Book.isbn).filter(Book.isbn.in_(list(isbns)))}
+
+def add_books(books):
+    """Insert a batch of new books in one transaction"""
+    save_books(books, update_existing=False)
 
 def update_book(isbn, title, copies_available, author_names=None, genre_names=None):
-    book = Book.query.get(isbn)
-    if not book:
+    if not get_existing_isbns([isbn]):
         raise ValueError("Book not found")
-    book.title = title
-    book.copies_available = copies_available
-    if author_names:
-        book.authors = [Author.query.filter_by(name=name).first() or Author(name=name) for name in author_names]
-    if genre_names:
-        book.genres = [Genre.query.filter_by(name=name).first() or Genre(name=name) for name in genre_names]
-    db.session.commit()
+    save_books([{
+        'isbn': isbn,
+        'title': title,
+        'copies': copies_available,
+        'authors': author_names,
+        'genres': genre_names
+    }])
 
 def delete_book(isbn):
     book = Book.query.get(isbn)
     if not book:
         raise ValueError("Book not found")
     db.session.delete(book)
+    touch_scopes(CATALOG_SCOPE)
     db.session.commit()
 
+RETRYABLE_SQLSTATES = {'40001', '40P01'}  # serialization_failure, deadlock_detected
+TRANSITION_RETRIES = 5
+
+def _with_retry(func):
+    """Roll back and re-run a circulation transition on serialization/deadlock errors"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(TRANSITION_RETRIES):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                db.session.rollback()
+                if getattr(e.orig, 'pgcode', None) not in RETRYABLE_SQLSTATES or attempt == TRANSITION_RETRIES - 1:
+                    raise
+                time.sleep(0.01 * 2 ** attempt)
+    return wrapper
+
+def _take_copy(isbn):
+    """Single-statement decrement guarded by copies_available > 0"""
+    return db.session.execute(
+        update(Book)
+        .where(Book.isbn == isbn, Book.copies_available > 0)
+        .values(copies_available=Book.copies_available - 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+def _release_copy(isbn):
+    db.session.execute(
+        update(Book)
+        .where(Book.isbn == isbn)
+        .values(copies_available=Book.copies_available + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+def _transition_record(record_id, from_statuses, **values):
+    """Move a record to a new state only if it is still in one of from_statuses.
+
+    Returns the record's (book ISBN, user id), or None if the record is missing or in another state.
+    """
+    return db.session.execute(
+        update(BorrowRecord)
+        .where(BorrowRecord.id == record_id, BorrowRecord.status.in_(from_statuses))
+        .values(**values)
+        .returning(BorrowRecord.book_isbn, BorrowRecord.user_id)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+def _record_exists(record_id):
+    return db.session.query(BorrowRecord.id).filter_by(id=record_id).first() is not None
+
+@_with_retry
 def reserve_book(isbn, user_id, reservation_days=3):
-    book = Book.query.get(isbn)
-    if not book:
-        raise ValueError("Book not found")
-    if book.copies_available <= 0:
+    if not _take_copy(isbn):
+        db.session.rollback()
+        if not db.session.query(Book.isbn).filter_by(isbn=isbn).first():
+            raise ValueError("Book not found")
         raise ValueError("No copies available")
 
     reservation_expiry = date.today() + timedelta(days=reservation_days)
@@ -50,57 +262,95 @@ def reserve_book(isbn, user_id, reservation_days=3):
         reservation_expiry=reservation_expiry,
         status='reserved'
     )
-    book.copies_available -= 1
     db.session.add(borrow_record)
+    touch_scopes(CATALOG_SCOPE, user_scope(user_id))
     db.session.commit()
     return borrow_record.id
 
+@_with_retry
 def issue_book(record_id):
-    borrow_record = BorrowRecord.query.get(record_id)
-    if not borrow_record:
-        raise ValueError("Borrow record not found")
-    if borrow_record.status != 'reserved':
+    """Issue a reserved record; returns (book ISBN, user id)"""
+    record = _transition_record(
+        record_id, ['reserved'],
+        status='issued',
+        issue_date=date.today(),
+        reservation_expiry=None
+    )
+    if not record:
+        db.session.rollback()
+        if not _record_exists(record_id):
+            raise ValueError("Borrow record not found")
         raise ValueError("Book is not in reserved status")
-
-    borrow_record.status = 'issued'
-    borrow_record.issue_date = date.today()
-    borrow_record.reservation_expiry = None   
+    touch_scopes(CATALOG_SCOPE, user_scope(record.user_id))
     db.session.commit()
-    return borrow_record.id
+    return tuple(record)
 
+@_with_retry
 def cancel_reservation(record_id):
-    borrow_record = BorrowRecord.query.get(record_id)
-    if not borrow_record:
-        raise ValueError("Borrow record not found")
-    if borrow_record.status not in ['reserved', 'issued']:
+    """Cancel a reserved or issued record and put the copy back; returns (book ISBN, user id)"""
+    record = _transition_record(record_id, ['reserved', 'issued'], status='cancelled')
+    if not record:
+        db.session.rollback()
+        if not _record_exists(record_id):
+            raise ValueError("Borrow record not found")
         raise ValueError("Cannot cancel this record")
-
-    borrow_record.status = 'cancelled'
     # Вернуть копию в фонд
-    book = Book.query.get(borrow_record.book_isbn)
-    book.copies_available += 1
+    _release_copy(record.book_isbn)
+    touch_scopes(CATALOG_SCOPE, user_scope(record.user_id))
     db.session.commit()
-    return borrow_record.id
+    return tuple(record)
 
+@_with_retry
 def return_book(isbn, user_id):
-    from datetime import date
-    borrow_record = BorrowRecord.query.filter_by(
+    # SKIP LOCKED: параллельные возвраты одним читателем забирают разные записи
+    issued_record = db.session.query(BorrowRecord.id).filter_by(
         book_isbn=isbn,
         user_id=user_id,
         status='issued'
-    ).first()
-
-    if not borrow_record:
+    ).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+    returned = _transition_record(
+        issued_record, ['issued'],
+        status='returned',
+        return_date=date.today()
+    )
+    if not returned:
+        db.session.rollback()
         raise ValueError("No active issued record found")
 
-    book = Book.query.get(isbn)
-    borrow_record.return_date = date.today()
-    borrow_record.status = 'returned'
-    book.copies_available += 1
+    _release_copy(isbn)
+    touch_scopes(CATALOG_SCOPE, user_scope(user_id))
+    db.session.commit()
+
+@_with_retry
+def return_book_by_record(record_id, return_date):
+    """Return an issued record on the given date; returns (book ISBN, user id)"""
+    record = _transition_record(record_id, ['issued'], status='returned', return_date=return_date)
+    if not record:
+        db.session.rollback()
+        if not _record_exists(record_id):
+            raise ValueError("Запись не найдена")
+        raise ValueError("Можно вернуть только выданные книги")
+    _release_copy(record.book_isbn)
+    touch_scopes(CATALOG_SCOPE, user_scope(record.user_id))
+    db.session.commit()
+    return tuple(record)
+
+@_with_retry
+def cancel_issued_book(record_id):
+    """Cancel an issued record and put the copy back; returns (book ISBN, user id)"""
+    record = _transition_record(record_id, ['issued'], status='cancelled')
+    if not record:
+        db.session.rollback()
+        if not _record_exists(record_id):
+            raise ValueError("Запись не найдена")
+        raise ValueError("Можно отменить только выданные книги")
+    _release_copy(record.book_isbn)
+    touch_scopes(CATALOG_SCOPE, user_scope(record.user_id))
     db.session.commit()
+    return tuple(record)
 
 def get_borrow_history(isbn=None, user_id=None):
-    query = BorrowRecord.query
+    query = BorrowRecord.query.options(joinedload(BorrowRecord.book))
     if isbn:
         query = query.filter_by(book_isbn=isbn)
     if user_id:
@@ -120,7 +370,9 @@ def get_borrow_history(isbn=None, user_id=None):
     } for r in records]
 
 def get_active_borrows(user_id=None):
-    query = BorrowRecord.query.filter(BorrowRecord.status.in_(['reserved', 'issued']))
+    query = BorrowRecord.query.options(joinedload(BorrowRecord.book)).filter(
+        BorrowRecord.status.in_(['reserved', 'issued'])
+    )
     if user_id:
         query = query.filter_by(user_id=user_id)
 
@@ -136,9 +388,61 @@ def get_active_borrows(user_id=None):
         'status': r.status
     } for r in records]
 
+def _isoformat_dates(row):
+    return {key: value.isoformat() if isinstance(value, date) else value for key, value in row.items()}
+
+def get_profile_data(user_id, returned_limit=10):
+    """Active borrows, the latest returned records and loan counters for one user.
+
+    Three bounded queries: titles are joined in, returned history is ordered
+    and limited in SQL, counters are aggregated by the database.
+    """
+    columns = [
+        BorrowRecord.id,
+        BorrowRecord.book_isbn,
+        Book.title.label('book_title'),
+        BorrowRecord.user_id,
+        BorrowRecord.borrow_date,
+        BorrowRecord.reservation_expiry,
+        BorrowRecord.issue_date,
+        BorrowRecord.return_date,
+        BorrowRecord.status
+    ]
+    records = select(*columns).join(Book, Book.isbn == BorrowRecord.book_isbn).where(BorrowRecord.user_id == user_id)
+
+    active = db.session.execute(
+        records.where(BorrowRecord.status.in_(['reserved', 'issued']))
+        .order_by(BorrowRecord.borrow_date.desc(), BorrowRecord.id.desc())
+    ).mappings()
+    returned = db.session.execute(
+        records.where(BorrowRecord.status == 'returned')
+        .order_by(BorrowRecord.return_date.desc().nulls_last(), BorrowRecord.id.desc())
+        .limit(returned_limit)
+    ).mappings()
+    total_loans, currently_held, reserved = db.session.execute(
+        select(
+            func.count().filter(BorrowRecord.issue_date.isnot(None)),
+            func.count().filter(BorrowRecord.status == 'issued'),
+            func.count().filter(BorrowRecord.status == 'reserved')
+        ).where(BorrowRecord.user_id == user_id)
+    ).one()
+
+    return {
+        'active_borrows': [_isoformat_dates(row) for row in active],
+        'returned_records': [_isoformat_dates(row) for row in returned],
+        'stats': {
+            'total_loans': total_loans,
+            'currently_held': currently_held,
+            'reserved': reserved
+        }
+    }
+
 def get_pending_reservations():
     """Get reservations that need admin action"""
-    query = BorrowRecord.query.filter_by(status='reserved')
+    query = BorrowRecord.query.options(
+        joinedload(BorrowRecord.book),
+        joinedload(BorrowRecord.user)
+    ).filter_by(status='reserved')
     records = query.all()
     return [{
         'id': r.id,
@@ -150,33 +454,70 @@ def get_pending_reservations():
         'reservation_expiry': r.reservation_expiry.isoformat() if r.reservation_expiry else None
     } for r in records]
 
-def cancel_expired_reservations():
-    """Cancel reservations that have expired"""
-    today = date.today()
-    expired_records = BorrowRecord.query.filter(
-        BorrowRecord.status == 'reserved',
-        BorrowRecord.reservation_expiry < today
-    ).all()
+# Advisory lock key: only one expiry sweep runs at a time across all workers and hosts
+EXPIRY_SWEEP_LOCK_KEY = 4242002
 
-    cancelled_count = 0
-    for record in expired_records:
-        record.status = 'cancelled'
-        book = Book.query.get(record.book_isbn)
-        book.copies_available += 1
-        cancelled_count += 1
+EXPIRED_RESERVATIONS_SQL = text("""
+    SELECT id, book_isbn FROM borrow_records
+    WHERE status = 'reserved' AND reservation_expiry < :today
+    ORDER BY id
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+""")
 
-    db.session.commit()
-    return cancelled_count
+EXPIRE_RESERVATIONS_SQL = text("""
+    WITH cancelled AS (
+        UPDATE borrow_records SET status = 'cancelled'
+        WHERE id = ANY(:ids)
+        RETURNING book_isbn, user_id
+    ), released AS (
+        UPDATE books b SET copies_available = b.copies_available + c.released
+        FROM (SELECT book_isbn, count(*) AS released FROM cancelled GROUP BY book_isbn) c
+        WHERE b.isbn = c.book_isbn
+        RETURNING b.isbn
+    )
+    SELECT (SELECT count(*) FROM cancelled), (SELECT count(*) FROM released),
+           ARRAY(SELECT DISTINCT user_id FROM cancelled)
+""")
 
-def get_all_records():
-    from sqlalchemy.orm import joinedload
-    
-    records = BorrowRecord.query.options(
-        joinedload(BorrowRecord.book),
-        joinedload(BorrowRecord.user)
+def cancel_expired_reservations(batch_size=500):
+    """Cancel one batch of expired reservations and return their copies.
+
+    Rows locked by concurrent transactions are skipped and picked up by the next batch.
+    Books are locked in ISBN order before the update, the same order for every sweep,
+    so concurrent batches cannot deadlock on them.
+    Returns (cancelled records, updated books, affected user ids), or None when
+    another sweep holds the advisory lock.
+    """
+    locked = db.session.execute(
+        text("SELECT pg_try_advisory_xact_lock(:key)"), {'key': EXPIRY_SWEEP_LOCK_KEY}
+    ).scalar()
+    if not locked:
+        db.session.rollback()
+        return None
+
+    expired = db.session.execute(
+        EXPIRED_RESERVATIONS_SQL,
+        {'today': date.today(), 'batch_size': batch_size}
     ).all()
-    
-    return [{
+    if not expired:
+        db.session.commit()
+        return 0, 0, []
+
+    isbns = sorted({isbn for _, isbn in expired})
+    db.session.execute(
+        select(Book.isbn).where(Book.isbn.in_(isbns)).order_by(Book.isbn).with_for_update()
+    ).all()
+    records, books, user_ids = db.session.execute(
+        EXPIRE_RESERVATIONS_SQL, {'ids': [record_id for record_id, _ in expired]}
+    ).one()
+    if records:
+        touch_scopes(CATALOG_SCOPE, *(user_scope(user_id) for user_id in user_ids))
+    db.session.commit()
+    return records, books, user_ids
+
+def _record_to_dict(r):
+    return {
         'id': r.id,
         'book_isbn': r.book_isbn,
         'book_title': r.book.title,
@@ -189,4 +530,120 @@ def get_all_records():
         'issue_date': r.issue_date.isoformat() if r.issue_date else None,
         'return_date': r.return_date.isoformat() if r.return_date else None,
         'status': r.status
-    } for r in records]
\ No newline at end of file
+    }
+
+def get_all_records():
+    records = BorrowRecord.query.options(
+        joinedload(BorrowRecord.book),
+        joinedload(BorrowRecord.user)
+    ).all()
+    
+    return [_record_to_dict(r) for r in records]
+
+def get_records_page(before=None, limit=50, status=None, user_email='', user_ticket=''):
+    """Newest records first, keyset-paginated by (borrow_date, id).
+
+    before is the (borrow_date, id) of the last record on the previous page.
+    Status, e-mail substring and ticket substring filters run in SQL.
+    """
+    query = BorrowRecord.query.join(BorrowRecord.book).join(BorrowRecord.user).options(
+        contains_eager(BorrowRecord.book),
+        contains_eager(BorrowRecord.user)
+    )
+    if status:
+        query = query.filter(BorrowRecord.status == status)
+    if user_email:
+        query = query.filter(User.email.ilike(f"%{_escape_like(user_email)}%", escape='\\'))
+    if user_ticket:
+        query = query.filter(User.ticket_number.like(f"%{_escape_like(user_ticket)}%", escape='\\'))
+    if before:
+        query = query.filter(tuple_(BorrowRecord.borrow_date, BorrowRecord.id) < before)
+    records = query.order_by(BorrowRecord.borrow_date.desc(), BorrowRecord.id.desc()).limit(limit).all()
+    return [_record_to_dict(r) for r in records]
+
+EXPORT_COLUMNS = [
+    'id', 'book_isbn', 'book_title', 'user_id', 'user_email', 'user_ticket', 'user_full_name',
+    'borrow_date', 'reservation_expiry', 'issue_date', 'return_date', 'status'
+]
+
+def iter_borrow_records(date_from=None, date_to=None, status=None, user_id=None, isbn=None, chunk_size=1000):
+    """Stream borrow records as lists of row dicts, chunk_size rows at a time.
+
+    Uses a server-side cursor, so memory stays constant whatever the row count.
+    """
+    query = select(
+        BorrowRecord.id,
+        BorrowRecord.book_isbn,
+        Book.title.label('book_title'),
+        BorrowRecord.user_id,
+        User.email.label('user_email'),
+        User.ticket_number.label('user_ticket'),
+        User.full_name.label('user_full_name'),
+        BorrowRecord.borrow_date,
+        BorrowRecord.reservation_expiry,
+        BorrowRecord.issue_date,
+        BorrowRecord.return_date,
+        BorrowRecord.status
+    ).join(Book, Book.isbn == BorrowRecord.book_isbn).join(User, User.id == BorrowRecord.user_id)
+    if date_from:
+        query = query.where(BorrowRecord.borrow_date >= date_from)
+    if date_to:
+        query = query.where(BorrowRecord.borrow_date <= date_to)
+    if status:
+        query = query.where(BorrowRecord.status == status)
+    if user_id:
+        query = query.where(BorrowRecord.user_id == user_id)
+    if isbn:
+        query = query.where(BorrowRecord.book_isbn == isbn)
+
+    result = db.session.execute(
+        query.order_by(BorrowRecord.id),
+        execution_options={'stream_results': True, 'yield_per': chunk_size}
+    )
+    for rows in result.mappings().partitions(chunk_size):
+        yield [dict(row) for row in rows]
+
+CATALOG_SCOPE = 'catalog'
+
+DATA_VERSION_SQL = text("SELECT version FROM data_versions WHERE scope = :scope")
+
+def user_scope(user_id):
+    """Version scope of one reader's borrow records (history, active borrows)"""
+    return f'user:{user_id}'
+
+def get_data_version(scope):
+    """Current version of a data scope (0 if never changed); plain Core query, no ORM session"""
+    with db.engine.connect() as connection:
+        return connection.execute(DATA_VERSION_SQL, {'scope': scope}).scalar() or 0
+
+def get_data_versions(scopes):
+    """Versions of several scopes in one query: {scope: version}, 0 for never changed"""
+    with db.engine.connect() as connection:
+        rows = dict(connection.execute(
+            select(data_versions.c.scope, data_versions.c.version).where(data_versions.c.scope.in_(scopes))
+        ).all())
+    return {scope: rows.get(scope, 0) for scope in scopes}
+
+def touch_scopes(*scopes):
+    """Mark data scopes as changed by the current transaction.
+
+    Their versions are bumped in the same transaction right before it commits,
+    so a committed write always comes with its version bump and a rollback drops both.
+    """
+    db.session.info.setdefault('changed_scopes', set()).update(scopes)
+
+@event.listens_for(Session, 'before_commit')
+def _bump_changed_scopes(session):
+    scopes = sorted(session.info.pop('changed_scopes', ()))
+    if not scopes:
+        return
+    # One statement, rows in sorted order so concurrent bumps lock them in the same order
+    statement = pg_insert(data_versions).values([{'scope': scope, 'version': 1} for scope in scopes])
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[data_versions.c.scope],
+        set_={'version': data_versions.c.version + 1}
+    ))
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_changed_scopes(session, previous_transaction):
+    session.info.pop('changed_scopes', None)
@@ -0,0 +1,89 @@
+import threading
+import time
+from flask import current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool, QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool, который считает время ожидания свободного соединения и таймауты"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            with self._wait_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._wait_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS из настроек DB_*.
+
+    В режиме pgbouncer (пулинг транзакций) пул держит сам pgbouncer: приложение
+    открывает соединение на каждую транзакцию (NullPool) и не оставляет на сервере
+    состояния сессии - таймауты задаются через SET LOCAL внутри транзакции.
+    """
+    if config['DB_PGBOUNCER']:
+        return {'poolclass': NullPool}
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING']
+    }
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow
+        })
+    if isinstance(pool, TimedQueuePool):
+        with pool._wait_lock:
+            stats.update({
+                'checkouts': pool.checkouts,
+                'timeouts': pool.timeouts,
+                'wait_total': round(pool.wait_total, 6),
+                'wait_avg': round(pool.wait_total / pool.checkouts, 6) if pool.checkouts else 0.0,
+                'wait_max': round(pool.wait_max, 6)
+            })
+    return stats
+
+
+@event.listens_for(Session, 'after_begin')
+def _set_statement_timeout(session, transaction, connection):
+    """SET LOCAL statement_timeout в начале каждой транзакции HTTP-запроса (DB_STATEMENT_TIMEOUT).
+
+    Фоновые задачи и CLI выполняются без ограничения.
+    """
+    if not has_request_context() or connection.dialect.name != 'postgresql':
+        return
+    timeout = current_app.config.get('DB_STATEMENT_TIMEOUT')
+    if timeout:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
@@ -0,0 +1,110 @@
+"""Версионированные миграции схемы.
+
+Каждая миграция - модуль app/db/migrations/NNNN_name.py с функцией upgrade(connection).
+Применённые версии записываются в таблицу schema_version.
+
+    python -m app.db.migrate upgrade    # применить недостающие миграции
+    python -m app.db.migrate current    # показать текущую и последнюю версии
+"""
+import importlib
+import pkgutil
+import sys
+from sqlalchemy import create_engine, text
+
+import app.db.migrations as migrations_package
+
+# Ключ advisory-блокировки: параллельные upgrade из нескольких контейнеров не мешают друг другу
+MIGRATION_LOCK_KEY = 4242001
+
+CREATE_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+    )
+"""
+
+
+class SchemaOutdated(Exception):
+    pass
+
+
+def available_migrations():
+    """Список (версия, имя модуля) по возрастанию версии"""
+    migrations = []
+    for module in pkgutil.iter_modules(migrations_package.__path__):
+        version, _, _ = module.name.partition('_')
+        if version.isdigit():
+            migrations.append((int(version), module.name))
+    return sorted(migrations)
+
+
+def latest_version():
+    migrations = available_migrations()
+    return migrations[-1][0] if migrations else 0
+
+
+def current_version(connection):
+    exists = connection.execute(text("SELECT to_regclass('schema_version') IS NOT NULL")).scalar()
+    if not exists:
+        return 0
+    return connection.execute(text("SELECT coalesce(max(version), 0) FROM schema_version")).scalar()
+
+
+def upgrade(engine, log=print):
+    """Применить недостающие миграции, каждую в своей транзакции. Возвращает итоговую версию."""
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+        connection.execute(text(CREATE_VERSION_TABLE))
+
+    version = 0
+    for version, name in available_migrations():
+        with engine.begin() as connection:
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+            if current_version(connection) >= version:
+                continue
+            log(f"Applying migration {name}")
+            module = importlib.import_module(f"{migrations_package.__name__}.{name}")
+            module.upgrade(connection)
+            connection.execute(
+                text("INSERT INTO schema_version (version, name) VALUES (:version, :name)"),
+                {'version': version, 'name': name}
+            )
+    return version
+
+
+def check_schema(engine):
+    """Проверка при старте приложения: один запрос версии, без интроспекции каталога"""
+    with engine.connect() as connection:
+        current = current_version(connection)
+    latest = latest_version()
+    if current < latest:
+        raise SchemaOutdated(
+            f"Database schema is at version {current}, application needs {latest}. "
+            f"Run: python -m app.db.migrate upgrade"
+        )
+    return current
+
+
+def main(argv):
+    from app import database_uri
+
+    command = argv[1] if len(argv) > 1 else 'upgrade'
+    engine = create_engine(database_uri())
+    try:
+        if command == 'upgrade':
+            version = upgrade(engine)
+            print(f"Schema is at version {version}")
+        elif command == 'current':
+            with engine.connect() as connection:
+                print(f"Current version: {current_version(connection)}, latest: {latest_version()}")
+        else:
+            print(__doc__)
+            return 1
+    finally:
+        engine.dispose()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,69 @@
+"""Исходная схема (как её создавал db.create_all).
+
+IF NOT EXISTS позволяет принять под управление базы, созданные до миграций.
+"""
+from sqlalchemy import text
+
+STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS authors (
+        id SERIAL NOT NULL,
+        name VARCHAR(50) NOT NULL,
+        PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS books (
+        isbn VARCHAR(13) NOT NULL,
+        title VARCHAR(30) NOT NULL,
+        copies_available INTEGER NOT NULL,
+        PRIMARY KEY (isbn)
+    )""",
+    """CREATE TABLE IF NOT EXISTS genres (
+        id SERIAL NOT NULL,
+        name VARCHAR(30) NOT NULL,
+        PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS users (
+        id SERIAL NOT NULL,
+        ticket_number VARCHAR(20),
+        email VARCHAR(120) NOT NULL,
+        password_hash VARCHAR(255),
+        full_name VARCHAR(100) NOT NULL,
+        role VARCHAR(20) NOT NULL,
+        created_at DATE NOT NULL,
+        is_active BOOLEAN,
+        PRIMARY KEY (id),
+        UNIQUE (ticket_number),
+        UNIQUE (email)
+    )""",
+    """CREATE TABLE IF NOT EXISTS book_authors (
+        book_isbn VARCHAR(13) NOT NULL,
+        author_id INTEGER NOT NULL,
+        PRIMARY KEY (book_isbn, author_id),
+        FOREIGN KEY (book_isbn) REFERENCES books (isbn),
+        FOREIGN KEY (author_id) REFERENCES authors (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS book_genres (
+        book_isbn VARCHAR(13) NOT NULL,
+        genre_id INTEGER NOT NULL,
+        PRIMARY KEY (book_isbn, genre_id),
+        FOREIGN KEY (book_isbn) REFERENCES books (isbn),
+        FOREIGN KEY (genre_id) REFERENCES genres (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS borrow_records (
+        id SERIAL NOT NULL,
+        book_isbn VARCHAR(13) NOT NULL,
+        user_id INTEGER NOT NULL,
+        borrow_date DATE NOT NULL,
+        reservation_expiry DATE,
+        issue_date DATE,
+        return_date DATE,
+        status VARCHAR(20) NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY (book_isbn) REFERENCES books (isbn),
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )""",
+]
+
+
+def upgrade(connection):
+    for statement in STATEMENTS:
+        connection.execute(text(statement))
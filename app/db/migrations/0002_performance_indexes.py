@@ -0,0 +1,32 @@
+"""Индексы под поиск по каталогу, страницу управления, историю и фоновую отмену броней"""
+from sqlalchemy import text
+
+STATEMENTS = [
+    # Поиск подстроки (ILIKE '%...%') по названию, ISBN и автору
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_books_title_trgm ON books USING gin (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_books_isbn_trgm ON books USING gin (isbn gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_authors_name_trgm ON authors USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_authors_name ON authors (name)",
+    "CREATE INDEX IF NOT EXISTS ix_genres_name ON genres (name)",
+    "CREATE INDEX IF NOT EXISTS ix_book_authors_author_id ON book_authors (author_id)",
+    "CREATE INDEX IF NOT EXISTS ix_book_genres_genre_id ON book_genres (genre_id)",
+    # Keyset-пагинация и фильтры записей
+    "CREATE INDEX IF NOT EXISTS ix_borrow_records_date_id ON borrow_records (borrow_date DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_borrow_records_status_date_id ON borrow_records (status, borrow_date DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_borrow_records_user_date_id ON borrow_records (user_id, borrow_date DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_borrow_records_book_isbn ON borrow_records (book_isbn)",
+    # Активные выдачи и брони читателя, просроченные брони
+    "CREATE INDEX IF NOT EXISTS ix_borrow_records_active_user ON borrow_records (user_id) "
+    "WHERE status IN ('reserved', 'issued')",
+    "CREATE INDEX IF NOT EXISTS ix_borrow_records_reserved_expiry ON borrow_records (reservation_expiry) "
+    "WHERE status = 'reserved'",
+    # Фильтры по email и номеру билета
+    "CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (email gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_ticket_number_trgm ON users USING gin (ticket_number gin_trgm_ops)",
+]
+
+
+def upgrade(connection):
+    for statement in STATEMENTS:
+        connection.execute(text(statement))
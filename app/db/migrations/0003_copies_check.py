@@ -0,0 +1,17 @@
+"""Запрет отрицательного числа копий: последняя линия защиты от перепродажи экземпляров"""
+from sqlalchemy import text
+
+
+def upgrade(connection):
+    connection.execute(text("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'ck_books_copies_available_non_negative'
+            ) THEN
+                ALTER TABLE books
+                    ADD CONSTRAINT ck_books_copies_available_non_negative CHECK (copies_available >= 0);
+            END IF;
+        END
+        $$
+    """))
@@ -0,0 +1,11 @@
+"""Счётчики версий данных для ETag: каталог ('catalog') и выдачи каждого читателя ('user:<id>')"""
+from sqlalchemy import text
+
+
+def upgrade(connection):
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            scope VARCHAR(50) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+    """))
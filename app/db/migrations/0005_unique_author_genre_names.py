@@ -0,0 +1,36 @@
+"""Уникальные имена авторов и жанров: ключ для INSERT ... ON CONFLICT при пакетной записи каталога.
+
+Существующие дубликаты сливаются в запись с наименьшим id, связи с книгами переносятся на неё.
+"""
+from sqlalchemy import text
+
+# (таблица, таблица связей, колонка связи)
+TABLES = [
+    ('authors', 'book_authors', 'author_id'),
+    ('genres', 'book_genres', 'genre_id'),
+]
+
+
+def upgrade(connection):
+    for table, link_table, column in TABLES:
+        # Новые имена не должны появиться между слиянием и созданием индекса
+        connection.execute(text(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE"))
+        connection.execute(text(f"""
+            CREATE TEMPORARY TABLE name_duplicates AS
+            SELECT id, keep_id FROM (
+                SELECT id, min(id) OVER (PARTITION BY name) AS keep_id FROM {table}
+            ) ranked
+            WHERE id <> keep_id
+        """))
+        connection.execute(text(f"""
+            INSERT INTO {link_table} (book_isbn, {column})
+            SELECT l.book_isbn, d.keep_id
+            FROM {link_table} l JOIN name_duplicates d ON d.id = l.{column}
+            ON CONFLICT DO NOTHING
+        """))
+        connection.execute(text(f"DELETE FROM {link_table} l USING name_duplicates d WHERE l.{column} = d.id"))
+        connection.execute(text(f"DELETE FROM {table} t USING name_duplicates d WHERE t.id = d.id"))
+        connection.execute(text("DROP TABLE name_duplicates"))
+        # Обычный индекс из 0002 заменяется уникальным
+        connection.execute(text(f"DROP INDEX IF EXISTS ix_{table}_name"))
+        connection.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table}_name ON {table} (name)"))
@@ -0,0 +1,77 @@
+import threading
+from contextlib import contextmanager
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    """Считает SQL-запросы, выполненные текущим потоком"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __enter__(self):
+        _active_counters().append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _active_counters().remove(self)
+        return False
+
+
+def _active_counters():
+    if not hasattr(_local, 'counters'):
+        _local.counters = []
+    return _local.counters
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    for counter in _active_counters():
+        counter.count += 1
+        counter.statements.append(statement)
+
+
+@contextmanager
+def max_queries(limit):
+    """Падает, если блок выполнил больше limit запросов (защита от N+1 в тестах)"""
+    with QueryCounter() as counter:
+        yield counter
+    if counter.count > limit:
+        raise QueryBudgetExceeded(
+            f"Expected at most {limit} queries, got {counter.count}:\n" + "\n".join(counter.statements)
+        )
+
+
+def init_query_budget(app):
+    """Включает проверку числа запросов на каждый HTTP-запрос (SQL_QUERY_BUDGET)"""
+    limit = app.config.get('SQL_QUERY_BUDGET')
+    if not limit:
+        return
+
+    @app.before_request
+    def _start_query_counter():
+        g.query_counter = QueryCounter().__enter__()
+
+    @app.after_request
+    def _check_query_budget(response):
+        counter = g.get('query_counter')
+        if counter is not None and counter.count > limit:
+            raise QueryBudgetExceeded(
+                f"Request issued {counter.count} queries, budget is {limit}:\n" + "\n".join(counter.statements)
+            )
+        return response
+
+    @app.teardown_request
+    def _stop_query_counter(exc):
+        counter = g.pop('query_counter', None)
+        if counter is not None:
+            counter.__exit__(None, None, None)
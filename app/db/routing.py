@@ -0,0 +1,160 @@
+"""Маршрутизация чтения на реплику.
+
+Функции сервисов, помеченные @read_only, выполняют SELECT на реплике (bind 'replica'),
+если она настроена (DB_REPLICA_HOST). Остаются на основной базе:
+- любые записи и SELECT ... FOR UPDATE;
+- чтения в HTTP-запросе, который уже что-то записал, и в запросах того же клиента
+  в течение DB_REPLICA_STICKY секунд после записи (read-your-writes);
+- все чтения, пока отставание реплики больше DB_REPLICA_MAX_LAG или она недоступна;
+- чтения внутри блока primary() - данные, которые кэшируются под версией,
+  прочитанной с основной базы.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from flask import current_app, g, has_request_context, session as http_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import TextClause
+
+REPLICA_BIND = 'replica'
+STICKY_KEY = '_db_primary_until'
+
+# Отставание в секундах; 0, если реплика догнала основную базу или это не реплика вовсе
+# (две независимые базы при локальной проверке)
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+_read_only = ContextVar('read_only', default=False)
+_primary = ContextVar('primary', default=False)
+_lock = threading.Lock()
+_lag = {'checked_at': None, 'value': None}
+_stats = {'replica_reads': 0, 'lag_fallbacks': 0, 'sticky_fallbacks': 0}
+
+
+def read_only(func):
+    """Функция только читает данные: её SELECT можно выполнять на реплике"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _read_only.set(True)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _read_only.reset(token)
+    return wrapper
+
+
+@contextmanager
+def primary():
+    """Все чтения внутри блока - с основной базы, в том числе в функциях @read_only"""
+    token = _primary.set(True)
+    try:
+        yield
+    finally:
+        _primary.reset(token)
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _is_plain_select(clause):
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+def _is_write(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        return True
+    statement = state.statement
+    return isinstance(statement, TextClause) and not statement.text.lstrip().upper().startswith('SELECT')
+
+
+def _wrote_recently():
+    if not has_request_context():
+        return False
+    if g.get('db_wrote'):
+        return True
+    return http_session.get(STICKY_KEY, 0) > time.time()
+
+
+def replica_lag(engine):
+    """Отставание реплики в секундах (None - недоступна), проверяется не чаще DB_REPLICA_CHECK_INTERVAL"""
+    interval = current_app.config.get('DB_REPLICA_CHECK_INTERVAL', 2)
+    now = time.monotonic()
+    with _lock:
+        if _lag['checked_at'] is not None and now - _lag['checked_at'] < interval:
+            return _lag['value']
+        _lag['checked_at'] = now
+    try:
+        with engine.connect() as connection:
+            lag = float(connection.execute(REPLICA_LAG_SQL).scalar())
+    except SQLAlchemyError:
+        current_app.logger.warning("Replica is unavailable, reading from primary", exc_info=True)
+        lag = None
+    with _lock:
+        _lag['value'] = lag
+    return lag
+
+
+def _replica_engine(engines):
+    if _primary.get() or not _read_only.get() or REPLICA_BIND not in engines:
+        return None
+    if _wrote_recently():
+        _count('sticky_fallbacks')
+        return None
+    engine = engines[REPLICA_BIND]
+    lag = replica_lag(engine)
+    if lag is None or lag > current_app.config.get('DB_REPLICA_MAX_LAG', 5):
+        _count('lag_fallbacks')
+        return None
+    return engine
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _is_plain_select(clause):
+            engine = _replica_engine(self._db.engines)
+            if engine is not None:
+                _count('replica_reads')
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _track_writes(orm_execute_state):
+    if has_request_context() and _is_write(orm_execute_state):
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _track_flush(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+def init_read_your_writes(app):
+    """После запроса с записью следующие запросы клиента читают с основной базы DB_REPLICA_STICKY секунд"""
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+
+    @app.after_request
+    def _stick_to_primary(response):
+        if g.get('db_wrote'):
+            http_session[STICKY_KEY] = time.time() + app.config['DB_REPLICA_STICKY']
+        return response
+
+
+def routing_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats['replica_lag'] = _lag['value']
+    return stats
@@ -1,9 +1,27 @@
+from functools import lru_cache
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import date
+from app.db.routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+DEFAULT_PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+
+
+def password_hash_method():
+    """Параметры хэширования паролей из PASSWORD_HASH_METHOD (формат werkzeug)"""
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_METHOD', DEFAULT_PASSWORD_HASH_METHOD)
+    return DEFAULT_PASSWORD_HASH_METHOD
+
+
+@lru_cache(maxsize=8)
+def _hash_prefix(method):
+    # "pbkdf2" -> "pbkdf2:sha256:600000": полный вид параметров, как он записывается в хэш
+    return generate_password_hash('', method).split('$', 1)[0]
 
 book_authors = db.Table('book_authors',
     db.Column('book_isbn', db.String(13), db.ForeignKey('books.isbn'), primary_key=True),
@@ -15,6 +33,12 @@ book_genres = db.Table('book_genres',
     db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True)
 )
 
+# Счётчики версий данных для ETag и кэшей (миграция 0004)
+data_versions = db.Table('data_versions',
+    db.Column('scope', db.String(50), primary_key=True),
+    db.Column('version', db.BigInteger, nullable=False, default=0)
+)
+
 class Book(db.Model):
     __tablename__ = 'books'
     isbn = db.Column(db.String(13), primary_key=True)
@@ -35,12 +59,12 @@ class Book(db.Model):
 class Author(db.Model):
     __tablename__ = 'authors'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(50), nullable=False)
+    name = db.Column(db.String(50), unique=True, nullable=False)
 
 class Genre(db.Model):
     __tablename__ = 'genres'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(30), nullable=False)
+    name = db.Column(db.String(30), unique=True, nullable=False)
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -55,10 +79,16 @@ class User(UserMixin, db.Model):
     
     def set_password(self, password):
         if password:
-            self.password_hash = generate_password_hash(password)
+            self.password_hash = generate_password_hash(password, password_hash_method())
         else:
             self.password_hash = None
 
+    def password_needs_rehash(self):
+        """Хэш посчитан с другими параметрами, чем сейчас заданы в PASSWORD_HASH_METHOD"""
+        if not self.password_hash:
+            return False
+        return self.password_hash.split('$', 1)[0] != _hash_prefix(password_hash_method())
+
     def check_password(self, password):
         if not self.password_hash:
             return False
@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+from datetime import date
+from flask import current_app
+from app.db import db
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+
+class ExportError(Exception):
+    pass
+
+
+def _parse_date(value, name):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"{name} must be a date in YYYY-MM-DD format")
+
+
+def _parse_int(value, name):
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ExportError(f"{name} must be an integer")
+
+
+def _serialize(row):
+    return {key: value.isoformat() if isinstance(value, date) else value for key, value in row.items()}
+
+
+def export_borrow_records(fmt='ndjson', date_from=None, date_to=None, status=None, user_id=None, isbn=None,
+                          chunk_size=None):
+    """Выгрузка истории выдач в NDJSON или CSV.
+
+    Фильтры применяются в SQL, записи читаются серверным курсором порциями
+    по chunk_size, генератор отдаёт текст по одной порции, так что память
+    не зависит от числа строк. Ошибки параметров проверяются до начала выгрузки.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Format must be one of: {', '.join(EXPORT_FORMATS)}")
+    filters = {
+        'date_from': _parse_date(date_from, 'date_from'),
+        'date_to': _parse_date(date_to, 'date_to'),
+        'status': status or None,
+        'user_id': _parse_int(user_id, 'user_id'),
+        'isbn': isbn or None,
+        'chunk_size': chunk_size or current_app.config.get('EXPORT_CHUNK_SIZE', 1000)
+    }
+    if fmt == 'csv':
+        return _export_csv(filters)
+    return _export_ndjson(filters)
+
+
+def _export_ndjson(filters):
+    for rows in db.iter_borrow_records(**filters):
+        yield ''.join(json.dumps(_serialize(row), ensure_ascii=False) + '\n' for row in rows)
+
+
+def _export_csv(filters):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=db.EXPORT_COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for rows in db.iter_borrow_records(**filters):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(_serialize(row) for row in rows)
+        yield buffer.getvalue()
@@ -1,41 +1,246 @@
+import os
+import sqlite3
+import threading
+import time
 import requests
+from flask import current_app
+from app.cache import TTLCache, SQLiteCache, SingleFlight
+from app.services.http_client import HttpClient, CircuitOpenError
+from app.services.library_service import AUTHOR_NAME_MAX_LENGTH, GENRE_NAME_MAX_LENGTH, TITLE_MAX_LENGTH
 
 GOOGLE_BOOKS_API_URL = "https://www.googleapis.com/books/v1/volumes"
 
-def search_books(query, max_results=10):
+
+class GoogleBooksError(Exception):
+    pass
+
+
+class GoogleBooksUnavailable(GoogleBooksError):
+    pass
+
+
+_MISSING = object()
+_cache_lock = threading.Lock()
+_memory_cache = None
+_disk_cache = None
+_stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+_client = None
+_client_pid = None
+# Одновременные запросы одного и того же поиска/ISBN уходят в API один раз
+_in_flight = SingleFlight()
+
+
+def _get_client():
+    """Общий для процесса клиент; после fork создаётся заново, чтобы не делить сокеты"""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _cache_lock:
+            if _client is None or _client_pid != os.getpid():
+                config = current_app.config
+                _client = HttpClient(
+                    config.get('GOOGLE_BOOKS_API_URL', GOOGLE_BOOKS_API_URL),
+                    pool_size=config.get('GOOGLE_BOOKS_POOL_SIZE', 10),
+                    timeout=config.get('GOOGLE_BOOKS_TIMEOUT', 10),
+                    retries=config.get('GOOGLE_BOOKS_RETRIES', 3),
+                    backoff_factor=config.get('GOOGLE_BOOKS_BACKOFF', 0.5),
+                    failure_threshold=config.get('GOOGLE_BOOKS_BREAKER_THRESHOLD', 5),
+                    reset_timeout=config.get('GOOGLE_BOOKS_BREAKER_RESET', 30)
+                )
+                _client_pid = os.getpid()
+    return _client
+
+
+def _fetch(params, timeout=None):
+    try:
+        return _get_client().get_json(params=params, timeout=timeout)
+    except CircuitOpenError as e:
+        raise GoogleBooksUnavailable(f"Google Books API is temporarily unavailable: {str(e)}")
+    except requests.RequestException as e:
+        raise GoogleBooksError(f"Error connecting to Google Books API: {str(e)}")
+    except ValueError as e:
+        raise GoogleBooksError(f"Error processing Google Books data: {str(e)}")
+
+
+def _caches():
+    """Ленивая инициализация кэшей по настройкам приложения"""
+    global _memory_cache, _disk_cache
+    if _memory_cache is None:
+        with _cache_lock:
+            if _memory_cache is None:
+                config = current_app.config
+                path = config.get('GOOGLE_BOOKS_CACHE_PATH')
+                if path is None:
+                    path = os.path.join(current_app.instance_path, 'google_books_cache.sqlite3')
+                _disk_cache = None
+                if path:
+                    try:
+                        _disk_cache = SQLiteCache(path)
+                    except (OSError, sqlite3.Error):
+                        current_app.logger.exception("Google Books disk cache %s is unavailable", path)
+                _memory_cache = TTLCache(
+                    maxsize=config.get('GOOGLE_BOOKS_CACHE_SIZE', 1024),
+                    ttl=config.get('GOOGLE_BOOKS_CACHE_TTL', 86400)
+                )
+    return _memory_cache, _disk_cache
+
+
+def _count(name):
+    with _cache_lock:
+        _stats[name] += 1
+
+
+def _cache_get(key):
+    memory_cache, disk_cache = _caches()
+    value = memory_cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _count('memory_hits')
+        return value
+    if disk_cache is not None:
+        try:
+            cached = disk_cache.get_with_expiry(key)
+        except sqlite3.Error:
+            # Дисковый кэш - только ускорение: ошибка файла считается промахом
+            current_app.logger.warning("Google Books disk cache read failed", exc_info=True)
+            cached = None
+        if cached is not None:
+            value, expires_at = cached
+            memory_cache.set(key, value, ttl=min(memory_cache.ttl, max(expires_at - time.time(), 0)))
+            _count('disk_hits')
+            return value
+    _count('misses')
+    return _MISSING
+
+
+def _cache_set(key, value):
+    _cache_set_many([(key, value)])
+
+
+def _cache_set_many(items):
+    """Записать пары (ключ, значение) в оба кэша; на диск - одной транзакцией"""
+    memory_cache, disk_cache = _caches()
+    entries = []
+    for key, value in items:
+        # Отрицательный результат ("не найдено") хранится меньше
+        if value is None:
+            ttl = current_app.config.get('GOOGLE_BOOKS_NEGATIVE_TTL', 3600)
+        else:
+            ttl = current_app.config.get('GOOGLE_BOOKS_CACHE_TTL', 86400)
+        memory_cache.set(key, value, ttl=ttl)
+        entries.append((key, value, ttl))
+    if disk_cache is not None:
+        try:
+            disk_cache.set_many(entries)
+        except sqlite3.Error:
+            current_app.logger.warning("Google Books disk cache write failed", exc_info=True)
+
+
+def purge_expired_cache():
+    """Удалить из дискового кэша истёкшие записи; возвращает их число"""
+    _, disk_cache = _caches()
+    if disk_cache is None:
+        return 0
+    return disk_cache.purge_expired()
+
+
+def _search_key(query, max_results):
+    return f"search:{' '.join(query.lower().split())}:{max_results}"
+
+
+def _normalize_isbn(isbn):
+    """978-5-17-090138-5, "978 5 17 090138 5" и 9785170901385 - один ISBN и одна запись кэша"""
+    return ''.join(str(isbn).split()).replace('-', '').upper()
+
+
+def _isbn_key(isbn):
+    return f"isbn:{_normalize_isbn(isbn)}"
+
+
+def invalidate_cache(isbn=None):
+    """Сбросить кэш целиком или запись одной книги"""
+    memory_cache, disk_cache = _caches()
+    if isbn:
+        memory_cache.invalidate(_isbn_key(isbn))
+        if disk_cache is not None:
+            disk_cache.invalidate(_isbn_key(isbn))
+    else:
+        memory_cache.clear()
+        if disk_cache is not None:
+            disk_cache.clear()
+
+
+def get_cache_stats():
+    memory_cache, disk_cache = _caches()
+    with _cache_lock:
+        stats = dict(_stats)
+    lookups = sum(stats.values())
+    hits = stats['memory_hits'] + stats['disk_hits']
+    return {
+        **stats,
+        'hit_rate': hits / lookups if lookups else 0.0,
+        'memory': memory_cache.stats(),
+        'disk_path': disk_cache.path if disk_cache is not None else None,
+        'circuit': _get_client().breaker.state,
+        'single_flight': _in_flight.stats()
+    }
+
+
+def _get_isbns(volume_info):
+    isbn_13 = None
+    isbn_10 = None
+    for identifier in volume_info.get('industryIdentifiers', []):
+        if identifier.get('type') == 'ISBN_13':
+            isbn_13 = identifier.get('identifier')
+        elif identifier.get('type') == 'ISBN_10':
+            isbn_10 = identifier.get('identifier')
+    return isbn_13, isbn_10
+
+
+def _book_from_volume(volume_info, isbn):
+    return {
+        'isbn': isbn,
+        'title': volume_info.get('title', 'Без названия')[:TITLE_MAX_LENGTH],
+        'authors': [name[:AUTHOR_NAME_MAX_LENGTH] for name in volume_info.get('authors', [])],
+        'categories': [name[:GENRE_NAME_MAX_LENGTH] for name in volume_info.get('categories', [])],
+        'publisher': volume_info.get('publisher', 'Неизвестно'),
+        'published_date': volume_info.get('publishedDate', 'Неизвестно'),
+        'description': volume_info.get('description', 'Описание отсутствует'),
+        'page_count': volume_info.get('pageCount', 0),
+        'thumbnail': volume_info.get('imageLinks', {}).get('thumbnail', '')
+    }
+
+
+def search_books(query, max_results=10, timeout=None):
+    key = _search_key(query, max_results)
+    cached = _cache_get(key)
+    if cached is not _MISSING:
+        return cached
+    return _in_flight.do(key, lambda: _search_upstream(key, query, max_results, timeout))
+
+
+def _search_upstream(key, query, max_results, timeout):
+    data = _fetch({
+        'q': query,
+        'maxResults': max_results,
+        'langRestrict': 'ru'
+    }, timeout)
     try:
-        params = {
-            'q': query,
-            'maxResults': max_results,
-            'langRestrict': 'ru'
-        }
-        response = requests.get(GOOGLE_BOOKS_API_URL, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
         if 'items' not in data:
+            _cache_set(key, [])
             return []
-        
+
         books = []
+        entries = []
         for item in data['items']:
             volume_info = item.get('volumeInfo', {})
-            industry_identifiers = volume_info.get('industryIdentifiers', [])
-            
-            isbn_13 = None
-            isbn_10 = None
-            for identifier in industry_identifiers:
-                if identifier.get('type') == 'ISBN_13':
-                    isbn_13 = identifier.get('identifier')
-                elif identifier.get('type') == 'ISBN_10':
-                    isbn_10 = identifier.get('identifier')
-            
+            isbn_13, isbn_10 = _get_isbns(volume_info)
+
             isbn = isbn_13 or isbn_10 or 'N/A'
-            
+
             book = {
                 'isbn': isbn,
-                'title': volume_info.get('title', 'Без названия')[:30],
-                'authors': volume_info.get('authors', []),
-                'categories': volume_info.get('categories', []),
+                'title': volume_info.get('title', 'Без названия')[:TITLE_MAX_LENGTH],
+                'authors': [name[:AUTHOR_NAME_MAX_LENGTH] for name in volume_info.get('authors', [])],
+                'categories': [name[:GENRE_NAME_MAX_LENGTH] for name in volume_info.get('categories', [])],
                 'publisher': volume_info.get('publisher', 'Неизвестно'),
                 'published_date': volume_info.get('publishedDate', 'Неизвестно'),
                 'description': volume_info.get('description', 'Описание отсутствует')[:200],
@@ -45,37 +250,36 @@ def search_books(query, max_results=10):
                 'preview_link': volume_info.get('previewLink', '')
             }
             books.append(book)
-        
+
+            # Импорт найденной книги потом обойдётся без запроса к API
+            for found_isbn in (isbn_13, isbn_10):
+                if found_isbn:
+                    entries.append((_isbn_key(found_isbn), _book_from_volume(volume_info, found_isbn)))
+
+        entries.append((key, books))
+        _cache_set_many(entries)
         return books
-    except requests.RequestException as e:
-        raise Exception(f"Error connecting to Google Books API: {str(e)}")
-    except Exception as e:
-        raise Exception(f"Error processing Google Books data: {str(e)}")
+    except (AttributeError, KeyError, TypeError) as e:
+        raise GoogleBooksError(f"Error processing Google Books data: {str(e)}")
+
+def get_book_by_isbn(isbn, timeout=None):
+    isbn = _normalize_isbn(isbn)
+    key = _isbn_key(isbn)
+    cached = _cache_get(key)
+    if cached is not _MISSING:
+        return cached
+    return _in_flight.do(key, lambda: _isbn_upstream(key, isbn, timeout))
 
-def get_book_by_isbn(isbn):
+
+def _isbn_upstream(key, isbn, timeout):
+    data = _fetch({'q': f'isbn:{isbn}'}, timeout)
     try:
-        params = {'q': f'isbn:{isbn}'}
-        response = requests.get(GOOGLE_BOOKS_API_URL, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
         if 'items' not in data or len(data['items']) == 0:
+            _cache_set(key, None)
             return None
-        
-        volume_info = data['items'][0].get('volumeInfo', {})
-        
-        return {
-            'isbn': isbn,
-            'title': volume_info.get('title', 'Без названия')[:30],
-            'authors': volume_info.get('authors', []),
-            'categories': volume_info.get('categories', []),
-            'publisher': volume_info.get('publisher', 'Неизвестно'),
-            'published_date': volume_info.get('publishedDate', 'Неизвестно'),
-            'description': volume_info.get('description', 'Описание отсутствует'),
-            'page_count': volume_info.get('pageCount', 0),
-            'thumbnail': volume_info.get('imageLinks', {}).get('thumbnail', '')
-        }
-    except requests.RequestException as e:
-        raise Exception(f"Error connecting to Google Books API: {str(e)}")
-    except Exception as e:
-        raise Exception(f"Error processing Google Books data: {str(e)}")
\ No newline at end of file
+
+        book = _book_from_volume(data['items'][0].get('volumeInfo', {}), isbn)
+        _cache_set(key, book)
+        return book
+    except (AttributeError, KeyError, TypeError) as e:
+        raise GoogleBooksError(f"Error processing Google Books data: {str(e)}")
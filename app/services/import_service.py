@@ -0,0 +1,156 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app.db import db
+from app.models import db as models_db
+from app.services import google_books_service, library_service
+
+
+def parse_isbn_lines(lines, default_copies=1):
+    """Разобрать строки вида "isbn" или "isbn,copies" (пустые строки и # пропускаются)"""
+    items = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        isbn, _, copies = line.partition(',')
+        items.append({'isbn': isbn.strip(), 'copies': copies.strip() or default_copies})
+    return items
+
+
+def normalize_items(items, default_copies=1):
+    """Привести элементы запроса к {'isbn', 'copies'}: строка - это ISBN с default_copies.
+
+    Проверяет только форму (ValueError), сами значения - _validate_item при импорте.
+    """
+    if not isinstance(items, list):
+        raise ValueError("Items must be a list")
+    normalized = []
+    for item in items:
+        if isinstance(item, (str, int)) and not isinstance(item, bool):
+            normalized.append({'isbn': str(item), 'copies': default_copies})
+        elif isinstance(item, dict):
+            normalized.append({'isbn': item.get('isbn'), 'copies': item.get('copies', default_copies)})
+        else:
+            raise ValueError("Each item must be an ISBN string or an object with isbn and copies")
+    return normalized
+
+
+def _validate_item(item):
+    isbn = str(item.get('isbn') or '').strip()
+    try:
+        copies = int(item.get('copies', 1))
+    except (TypeError, ValueError):
+        return isbn, None, "Copies must be an integer"
+    if not isbn.isdigit() or len(isbn) != 13:
+        return isbn, None, "ISBN must be 13 digits"
+    if copies < 0:
+        return isbn, None, "Copies available cannot be negative"
+    return isbn, copies, None
+
+
+def _insert_batch(batch):
+    """Вставить пакет одной транзакцией; при конфликте - по одной, чтобы найти виновника"""
+    try:
+        db.add_books(batch)
+        library_service.notify_catalog_changed()
+        return [(book['isbn'], 'imported', None) for book in batch]
+    except IntegrityError:
+        models_db.session.rollback()
+
+    results = []
+    for book in batch:
+        try:
+            db.add_books([book])
+            library_service.notify_catalog_changed()
+            results.append((book['isbn'], 'imported', None))
+        except IntegrityError as e:
+            models_db.session.rollback()
+            # Книгу с этим ISBN успел вставить другой запрос; иначе нарушено другое ограничение
+            if db.get_existing_isbns([book['isbn']]):
+                results.append((book['isbn'], 'exists', "ISBN already exists"))
+            else:
+                results.append((book['isbn'], 'error', f"Could not insert book: {e.orig}"))
+    return results
+
+
+def import_isbns(items, workers=None, batch_size=None):
+    """Массовый импорт книг из Google Books.
+
+    items - список {'isbn', 'copies'}. Метаданные загружаются параллельно пулом
+    из workers потоков, уже существующие ISBN отсекаются одним запросом,
+    найденные книги вставляются пакетами по batch_size. Генератор выдаёт
+    результат по каждому ISBN по мере готовности, последним - итоговую статистику.
+    """
+    app = current_app._get_current_object()
+    workers = workers or app.config.get('IMPORT_WORKERS', 8)
+    batch_size = batch_size or app.config.get('IMPORT_BATCH_SIZE', 100)
+    started = time.perf_counter()
+    counts = {}
+
+    def result(isbn, status, error=None):
+        counts[status] = counts.get(status, 0) + 1
+        line = {'isbn': isbn, 'status': status}
+        if error:
+            line['error'] = error
+        return line
+
+    copies_by_isbn = {}
+    for item in items:
+        isbn, copies, error = _validate_item(item)
+        if error:
+            yield result(isbn, 'invalid', error)
+        elif isbn in copies_by_isbn:
+            yield result(isbn, 'duplicate', "ISBN repeated in input")
+        else:
+            copies_by_isbn[isbn] = copies
+
+    existing = db.get_existing_isbns(copies_by_isbn)
+    for isbn in existing:
+        yield result(isbn, 'exists', "ISBN already exists")
+    to_fetch = [isbn for isbn in copies_by_isbn if isbn not in existing]
+
+    def fetch(isbn):
+        with app.app_context():
+            return google_books_service.get_book_by_isbn(isbn)
+
+    batch = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fetch, isbn): isbn for isbn in to_fetch}
+        for future in as_completed(futures):
+            isbn = futures[future]
+            try:
+                book_data = future.result()
+            except Exception as e:
+                yield result(isbn, 'error', str(e))
+                continue
+            if not book_data:
+                yield result(isbn, 'not_found', "Book not found in Google Books")
+                continue
+
+            batch.append({
+                'isbn': isbn,
+                'title': book_data['title'] or 'Без названия',
+                'copies': copies_by_isbn[isbn],
+                # Имена из Google Books обрезаются по длине колонок, как и название
+                'authors': [name[:library_service.AUTHOR_NAME_MAX_LENGTH] for name in book_data.get('authors', [])],
+                'genres': [name[:library_service.GENRE_NAME_MAX_LENGTH] for name in book_data.get('categories', [])]
+            })
+            if len(batch) >= batch_size:
+                for row in _insert_batch(batch):
+                    yield result(*row)
+                batch = []
+
+    if batch:
+        for row in _insert_batch(batch):
+            yield result(*row)
+
+    duration = time.perf_counter() - started
+    total = sum(counts.values())
+    yield {'summary': {
+        'total': total,
+        **counts,
+        'duration': round(duration, 3),
+        'isbns_per_second': round(total / duration, 1) if duration else None
+    }}
@@ -1,5 +1,12 @@
+import threading
+import time
+from datetime import date
+from flask import current_app
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from app.cache import TTLCache, VersionedCache
 from app.db import db
-from app.models import Book
+from app.db.routing import primary, read_only
+from app.models import Author, Book, Genre, db as models_db
 
 class LibraryError(Exception):
     pass
@@ -10,34 +17,173 @@ class BookAlreadyExists(LibraryError):
 class BookNotFound(LibraryError):
     pass
 
+CATALOG_SCOPE = db.CATALOG_SCOPE
+user_scope = db.user_scope
+# Длины колонок books.title, authors.name и genres.name
+TITLE_MAX_LENGTH = Book.title.type.length
+AUTHOR_NAME_MAX_LENGTH = Author.name.type.length
+GENRE_NAME_MAX_LENGTH = Genre.name.type.length
+
+_catalog_cache = None
+_catalog_cache_lock = threading.Lock()
+_stats_cache = TTLCache(maxsize=1)
+
+def _get_catalog_cache():
+    """Кэш каталога процесса (None, если CATALOG_CACHE_SIZE = 0).
+
+    Записи этого процесса сбрасывают его сразу, записи других воркеров -
+    при следующем опросе версии каталога (не реже CATALOG_CACHE_POLL_INTERVAL секунд).
+    """
+    global _catalog_cache
+    size = current_app.config.get('CATALOG_CACHE_SIZE', 512)
+    if not size:
+        return None
+    if _catalog_cache is None:
+        with _catalog_cache_lock:
+            if _catalog_cache is None:
+                _catalog_cache = VersionedCache(
+                    lambda: db.get_data_version(CATALOG_SCOPE),
+                    maxsize=size,
+                    poll_interval=current_app.config.get('CATALOG_CACHE_POLL_INTERVAL', 1.0)
+                )
+    return _catalog_cache
+
+def _cached(key, loader):
+    cache = _get_catalog_cache()
+    if cache is None:
+        return loader()
+    return cache.get_or_load(key, lambda: _load_from_primary(loader))
+
+def _load_from_primary(loader):
+    # Версия каталога читается с основной базы: значение, прочитанное с отстающей
+    # реплики, осталось бы в кэше под более новой версией
+    with primary():
+        return loader()
+
+def get_catalog_cache_stats():
+    cache = _get_catalog_cache()
+    return cache.stats() if cache is not None else None
+
+@read_only
 def get_books():
-    return db.get_all_books()
+    return _cached(('books',), db.get_all_books)
 
-def create_book(isbn, title, copies_available, author_names=None, genre_names=None):
+def get_book(isbn):
+    """Получить одну книгу по ISBN (из кэша каталога)"""
+    return _cached(('book', isbn), lambda: db.get_book(isbn))
+
+
+def get_data_versions(scopes):
+    return db.get_data_versions(scopes)
+
+def notify_catalog_changed():
+    """Сбросить кэши процесса после записи (вызывается после каждой записи).
+
+    Версии каталога и выдач читателей поднимает сама запись в db, в той же транзакции:
+    по ним кэши остальных воркеров и клиенты с ETag узнают об изменении.
+    """
+    cache = _get_catalog_cache()
+    if cache is not None:
+        cache.clear()
+    _stats_cache.clear()
+
+def _validate_book(isbn, title, copies_available):
     if not isbn or not title:
         raise LibraryError("ISBN and title are required")
-    if len(title) > 30:
-        raise LibraryError("Title must be 30 characters or less")
+    if len(title) > TITLE_MAX_LENGTH:
+        raise LibraryError(f"Title must be {TITLE_MAX_LENGTH} characters or less")
     if copies_available < 0:
         raise LibraryError("Copies available cannot be negative")
     if not isbn.isdigit() or len(isbn) != 13:
         raise LibraryError("ISBN must be 13 digits")
-    if Book.query.get(isbn):
+
+def _validate_names(author_names, genre_names):
+    if any(len(name) > AUTHOR_NAME_MAX_LENGTH for name in author_names or []):
+        raise LibraryError(f"Author name must be {AUTHOR_NAME_MAX_LENGTH} characters or less")
+    if any(len(name) > GENRE_NAME_MAX_LENGTH for name in genre_names or []):
+        raise LibraryError(f"Genre name must be {GENRE_NAME_MAX_LENGTH} characters or less")
+
+def create_book(isbn, title, copies_available, author_names=None, genre_names=None):
+    _validate_book(isbn, title, copies_available)
+    _validate_names(author_names, genre_names)
+    try:
+        db.add_book(isbn, title, copies_available, author_names, genre_names)
+    except IntegrityError:
+        models_db.session.rollback()
         raise BookAlreadyExists("ISBN already exists")
-    db.add_book(isbn, title, copies_available, author_names, genre_names)
+    notify_catalog_changed()
+
+def save_books(rows):
+    """Пакетное создание и обновление книг.
+
+    Ошибки валидации собираются по строкам и не отменяют весь пакет;
+    корректные строки записываются одной транзакцией.
+    """
+    max_rows = current_app.config.get('BATCH_MAX_ROWS', 5000)
+    if len(rows) > max_rows:
+        raise LibraryError(f"Batch is limited to {max_rows} books")
+
+    books = {}
+    errors = []
+    for index, row in enumerate(rows):
+        try:
+            if not isinstance(row, dict):
+                raise LibraryError("Book must be an object")
+            isbn = row.get('isbn')
+            title = row.get('title')
+            copies = row.get('copies', 1)
+            authors = row.get('authors', [])
+            genres = row.get('genres', [])
+            if not isinstance(isbn, str) or not isinstance(title, str):
+                raise LibraryError("ISBN and title are required")
+            if not isinstance(copies, int) or isinstance(copies, bool):
+                raise LibraryError("Copies must be an integer")
+            if not isinstance(authors, list) or not isinstance(genres, list):
+                raise LibraryError("Authors and genres must be lists")
+            _validate_book(isbn, title, copies)
+            authors = [str(a).strip() for a in authors if str(a).strip()]
+            genres = [str(g).strip() for g in genres if str(g).strip()]
+            _validate_names(authors, genres)
+            if isbn in books:
+                raise LibraryError("ISBN repeated in batch")
+            books[isbn] = {
+                'isbn': isbn,
+                'title': title,
+                'copies': copies,
+                'authors': authors,
+                'genres': genres
+            }
+        except LibraryError as e:
+            errors.append({'index': index, 'isbn': row.get('isbn') if isinstance(row, dict) else None, 'error': str(e)})
+
+    try:
+        created = db.save_books(list(books.values()))
+    except SQLAlchemyError:
+        models_db.session.rollback()
+        raise
+    if books:
+        notify_catalog_changed()
+    return {
+        'created': len(created),
+        'updated': len(books) - len(created),
+        'errors': errors
+    }
 
 def update_book(isbn, title, copies_available, author_names=None, genre_names=None):
     if not isbn or not title:
         raise LibraryError("ISBN and title are required")
-    if len(title) > 30:
-        raise LibraryError("Title must be 30 chars or less")
+    if len(title) > TITLE_MAX_LENGTH:
+        raise LibraryError(f"Title must be {TITLE_MAX_LENGTH} chars or less")
     if copies_available < 0:
         raise LibraryError("Copies cannot be negative")
     if not isbn.isdigit() or len(isbn) != 13:
         raise LibraryError("ISBN must be 13 digits")
-    if not Book.query.get(isbn):
+    _validate_names(author_names, genre_names)
+    try:
+        db.update_book(isbn, title, copies_available, author_names, genre_names)
+    except ValueError:
         raise BookNotFound("Book not found")
-    db.update_book(isbn, title, copies_available, author_names, genre_names)
+    notify_catalog_changed()
 
 def delete_book(isbn):
     if not isbn:
@@ -47,6 +193,7 @@ def delete_book(isbn):
     if not Book.query.get(isbn):
         raise BookNotFound("Book not found")
     db.delete_book(isbn)
+    notify_catalog_changed()
 
 def reserve_book(isbn, user_id, reservation_days=3):
     if not isbn or not user_id:
@@ -58,6 +205,7 @@ def reserve_book(isbn, user_id, reservation_days=3):
 
     try:
         record_id = db.reserve_book(isbn, user_id, reservation_days)
+        notify_catalog_changed()
         return record_id
     except ValueError as e:
         raise LibraryError(str(e))
@@ -67,16 +215,20 @@ def issue_book(record_id):
         raise LibraryError("Record ID is required")
 
     try:
-        return db.issue_book(record_id)
+        db.issue_book(record_id)
     except ValueError as e:
         raise LibraryError(str(e))
+    notify_catalog_changed()
+    return record_id
 
 def cancel_reservation(record_id):
     if not record_id:
         raise LibraryError("Record ID is required")
 
     try:
-        return db.cancel_reservation(record_id)
+        db.cancel_reservation(record_id)
+        notify_catalog_changed()
+        return record_id
     except ValueError as e:
         raise LibraryError(str(e))
 
@@ -90,27 +242,63 @@ def return_book(isbn, user_id):
     
     try:
         db.return_book(isbn, user_id)
+        notify_catalog_changed()
     except ValueError as e:
         raise LibraryError(str(e))
 
+@read_only
 def get_borrow_history(isbn=None, user_id=None):
     return db.get_borrow_history(isbn, user_id)
 
+@read_only
 def get_active_borrows(user_id=None):
     return db.get_active_borrows(user_id)
 
+@read_only
 def get_pending_reservations():
     return db.get_pending_reservations()
 
-def cancel_expired_reservations():
-    return db.cancel_expired_reservations()
+def cancel_expired_reservations(batch_size=500, max_batches=None):
+    """Отменить просроченные брони пакетами по batch_size записей.
 
+    Каждый пакет - отдельная короткая транзакция, поэтому большой хвост
+    просрочек не держит блокировки. Если пакет уже обрабатывает другой процесс
+    (advisory-блокировка занята), запуск завершается, locked=True в отчёте.
+    Возвращает число отменённых записей, обновлений книг, пакетов и длительность в секундах.
+    """
+    started = time.perf_counter()
+    report = {'records': 0, 'books': 0, 'batches': 0, 'locked': False}
+    while max_batches is None or report['batches'] < max_batches:
+        result = db.cancel_expired_reservations(batch_size)
+        if result is None:
+            report['locked'] = True
+            break
+        records, books, _ = result
+        report['batches'] += 1
+        report['records'] += records
+        report['books'] += books
+        if records < batch_size:
+            break
+    report['duration'] = round(time.perf_counter() - started, 3)
+    if report['records']:
+        notify_catalog_changed()
+    return report
+
+@read_only
 def get_all_records():
     return db.get_all_records()
 
 
+@read_only
 def search_books(query='', status_filter='all'):
     """Поиск и фильтрация книг"""
+    if current_app.config.get('SEARCH_BACKEND', 'database') == 'python':
+        return search_books_python(query, status_filter)
+    return _cached(('search', query, status_filter), lambda: db.search_books(query, status_filter))
+
+
+def search_books_python(query='', status_filter='all'):
+    """Поиск и фильтрация книг в памяти (прежняя реализация, для сравнения)"""
     books = get_books()
     
     if query:
@@ -129,27 +317,97 @@ def search_books(query='', status_filter='all'):
     return books
 
 
-def get_library_stats(all_books):
-    """Получить статистику по библиотеке"""
-    available_count = sum(1 for book in all_books if book['copies'] > 0)
-    total_count = len(all_books)
-    return {
-        'available': available_count,
-        'total': total_count
+def _page_size(limit=None):
+    default = current_app.config.get('PAGE_SIZE', 50)
+    if not limit or limit <= 0:
+        return default
+    return min(limit, current_app.config.get('MAX_PAGE_SIZE', 500))
+
+
+@read_only
+def search_books_page(query='', status_filter='all', after=None, limit=None, count=None):
+    """Страница результатов поиска (keyset-пагинация по ISBN).
+
+    count: None - без подсчёта, 'exact' - точное число результатов,
+    'estimate' - оценка размера всего каталога по статистике PostgreSQL.
+    """
+    limit = _page_size(limit)
+    return _cached(
+        ('page', query, status_filter, after, limit, count),
+        lambda: _search_books_page(query, status_filter, after, limit, count)
+    )
+
+
+def _search_books_page(query, status_filter, after, limit, count):
+    if current_app.config.get('SEARCH_BACKEND', 'database') == 'python':
+        books = sorted(search_books_python(query, status_filter), key=lambda b: b['isbn'])
+        books = [b for b in books if not after or b['isbn'] > after][:limit + 1]
+    else:
+        books = db.search_books(query, status_filter, after_isbn=after, limit=limit + 1)
+
+    page = {
+        'items': books[:limit],
+        'next_cursor': books[limit - 1]['isbn'] if len(books) > limit else None
     }
+    if count == 'exact':
+        page['total'] = db.count_books(query, status_filter)
+    elif count == 'estimate':
+        page['total'] = db.estimate_count('books')
+        page['total_estimated'] = True
+    return page
+
+
+def _parse_record_cursor(cursor):
+    try:
+        borrow_date, record_id = cursor.split('_')
+        return date.fromisoformat(borrow_date), int(record_id)
+    except ValueError:
+        raise LibraryError("Invalid cursor")
+
+
+@read_only
+def get_records_page(cursor=None, limit=None, status_filter='all', user_email='', user_ticket=''):
+    """Страница записей, от новых к старым (keyset-пагинация по дате и ID).
 
+    Фильтры по статусу, email и номеру билета применяются в запросе.
+    """
+    limit = _page_size(limit)
+    before = _parse_record_cursor(cursor) if cursor else None
+    records = db.get_records_page(
+        before, limit + 1,
+        status=None if status_filter == 'all' else status_filter,
+        user_email=user_email,
+        user_ticket=user_ticket
+    )
 
+    next_cursor = None
+    if len(records) > limit:
+        last = records[limit - 1]
+        next_cursor = f"{last['borrow_date']}_{last['id']}"
+    return {'items': records[:limit], 'next_cursor': next_cursor}
+
+
+@read_only
+def get_library_stats():
+    """Получить статистику по библиотеке.
+
+    Считается агрегатными запросами и кэшируется на STATS_CACHE_TTL секунд;
+    любая запись в каталог или выдачи через сервис сбрасывает кэш.
+    """
+    ttl = current_app.config.get('STATS_CACHE_TTL', 30)
+    if not ttl:
+        return db.get_library_stats()
+    stats = _stats_cache.get('stats')
+    if stats is None:
+        stats = db.get_library_stats()
+        _stats_cache.set('stats', stats, ttl)
+    return stats
+
+
+@read_only
 def prepare_profile_data(user_id):
     """Подготовить данные для профиля пользователя"""
-    active_borrows = get_active_borrows(user_id)
-    history = get_borrow_history(user_id=user_id)
-    
-    returned_records = [r for r in history if r['status'] == 'returned']
-    
-    return {
-        'active_borrows': active_borrows,
-        'returned_records': returned_records[:10]
-    }
+    return db.get_profile_data(user_id, current_app.config.get('PROFILE_HISTORY_LIMIT', 10))
 
 
 def filter_records(all_records, status_filter='all', user_email='', user_ticket=''):
@@ -171,35 +429,25 @@ def filter_records(all_records, status_filter='all', user_email='', user_ticket=
 
 def return_book_by_record(record_id, return_date):
     """Вернуть книгу по ID записи"""
-    from app.models import BorrowRecord, db as models_db
     from datetime import datetime
     
-    record = BorrowRecord.query.get(record_id)
-    if not record:
-        raise LibraryError("Запись не найдена")
-    
-    record.status = 'returned'
-    record.return_date = datetime.strptime(return_date, '%Y-%m-%d').date()
-    
-    book = record.book
-    book.copies_available += 1
+    if not record_id:
+        raise LibraryError("Record ID is required")
     
-    models_db.session.commit()
+    try:
+        db.return_book_by_record(record_id, datetime.strptime(return_date, '%Y-%m-%d').date())
+    except ValueError as e:
+        raise LibraryError(str(e))
+    notify_catalog_changed()
 
 
 def cancel_issued_book(record_id):
     """Отменить выданную книгу"""
-    from app.models import BorrowRecord, db as models_db
-    
-    record = BorrowRecord.query.get(record_id)
-    if not record:
-        raise LibraryError("Запись не найдена")
-    
-    if record.status != 'issued':
-        raise LibraryError("Можно отменить только выданные книги")
-    
-    record.status = 'cancelled'
-    book = record.book
-    book.copies_available += 1
+    if not record_id:
+        raise LibraryError("Record ID is required")
     
-    models_db.session.commit()
\ No newline at end of file
+    try:
+        db.cancel_issued_book(record_id)
+    except ValueError as e:
+        raise LibraryError(str(e))
+    notify_catalog_changed()
@@ -0,0 +1,89 @@
+import threading
+
+
+class PeriodicJob(threading.Thread):
+    """Фоновый поток, который раз в interval секунд вызывает func в контексте приложения"""
+
+    def __init__(self, app, name, interval, func):
+        super().__init__(name=name, daemon=True)
+        self.app = app
+        self.interval = interval
+        self.func = func
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    self.func()
+                except Exception:
+                    self.app.logger.exception("Background job %s failed", self.name)
+
+    def stop(self):
+        self._stopped.set()
+
+
+def start_expiry_sweeper(app):
+    """Запустить периодическую отмену просроченных броней (EXPIRY_SWEEP_INTERVAL)"""
+    interval = app.config.get('EXPIRY_SWEEP_INTERVAL', 0)
+    if interval <= 0:
+        return None
+
+    from app.services import library_service
+
+    def sweep():
+        report = library_service.cancel_expired_reservations(
+            batch_size=app.config['EXPIRY_SWEEP_BATCH_SIZE'],
+            max_batches=app.config['EXPIRY_SWEEP_MAX_BATCHES']
+        )
+        if report['records']:
+            app.logger.info(
+                "Expired reservations: %(records)d records, %(books)d book updates, "
+                "%(batches)d batches in %(duration).3fs", report
+            )
+
+    job = PeriodicJob(app, 'expiry-sweeper', interval, sweep)
+    job.start()
+    return job
+
+
+def start_cache_purger(app):
+    """Периодически удалять истёкшие записи дискового кэша Google Books
+    (GOOGLE_BOOKS_CACHE_PURGE_INTERVAL)"""
+    interval = app.config.get('GOOGLE_BOOKS_CACHE_PURGE_INTERVAL', 0)
+    if interval <= 0:
+        return None
+
+    from app.services import google_books_service
+
+    def purge():
+        purged = google_books_service.purge_expired_cache()
+        if purged:
+            app.logger.info("Google Books cache: purged %d expired entries", purged)
+
+    job = PeriodicJob(app, 'cache-purger', interval, purge)
+    job.start()
+    return job
+
+
+def start_background_jobs(app):
+    """Запустить все фоновые задачи процесса"""
+    return [start_expiry_sweeper(app), start_cache_purger(app)]
+
+
+def start_on_first_request(app):
+    """Запустить фоновые задачи с первым запросом к приложению.
+
+    Команды flask CLI и процесс-наблюдатель перезагрузчика (run.py с debug=True)
+    тоже вызывают create_app(), но запросов не обслуживают - поток в них не нужен.
+    """
+    lock = threading.Lock()
+    started = []
+
+    @app.before_request
+    def start_background_jobs():
+        if started:
+            return
+        with lock:
+            if not started:
+                started.extend(start_background_jobs(app))
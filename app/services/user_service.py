@@ -1,6 +1,162 @@
 from app.models import db, User
+from app.cache import TTLCache
+from flask import current_app
+from sqlalchemy import event, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from werkzeug.security import check_password_hash, generate_password_hash
+from app.models import password_hash_method
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import io
+import os
 import random
 import string
+import threading
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+_loader_stats = {'loads': 0, 'queries': 0}
+_verify_executor = None
+_verify_slots = None
+_verify_pid = None
+
+
+class PasswordCheckBusy(Exception):
+    pass
+
+
+def _get_user_cache():
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                _user_cache = TTLCache(
+                    maxsize=current_app.config.get('USER_CACHE_SIZE', 1024),
+                    ttl=current_app.config.get('USER_CACHE_TTL', 5)
+                )
+    return _user_cache
+
+
+def _snapshot(user):
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+
+def load_user(user_id):
+    """Пользователь для Flask-Login без запроса к БД на каждый HTTP-запрос.
+
+    Кэшируются значения колонок на USER_CACHE_TTL секунд (0 - без кэша); из них
+    собирается объект текущей сессии через merge(load=False), без SELECT.
+    Смена роли, is_active или пароля сбрасывает запись после commit в этом воркере,
+    в остальных - не позже чем через USER_CACHE_TTL. Деактивированный пользователь
+    не загружается (сессия входа перестаёт действовать).
+    """
+    user_id = int(user_id)
+    with _user_cache_lock:
+        _loader_stats['loads'] += 1
+    ttl = current_app.config.get('USER_CACHE_TTL', 5)
+    values = _get_user_cache().get(user_id) if ttl else None
+    if values is None:
+        with _user_cache_lock:
+            _loader_stats['queries'] += 1
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        if ttl:
+            _get_user_cache().set(user_id, _snapshot(user))
+    else:
+        user = User.__mapper__.class_manager.new_instance()
+        for key, value in values.items():
+            set_committed_value(user, key, value)
+        make_transient_to_detached(user)
+        user = db.session.merge(user, load=False)
+    if user.is_active is False:
+        return None
+    return user
+
+
+def invalidate_user(user_id):
+    if _user_cache is not None:
+        _user_cache.invalidate(user_id)
+
+
+def get_user_cache_stats():
+    with _user_cache_lock:
+        stats = dict(_loader_stats)
+    stats['queries_saved'] = stats['loads'] - stats['queries']
+    return {**stats, 'cache': _get_user_cache().stats()}
+
+
+def _on_security_change(target, value, oldvalue, initiator):
+    """Роль, активность или пароль изменились: сбросить кэш сейчас и ещё раз после commit"""
+    if target.id is None:
+        return
+    invalidate_user(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('invalidate_users', set()).add(target.id)
+
+
+for _attribute in (User.role, User.is_active, User.password_hash):
+    event.listen(_attribute, 'set', _on_security_change)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_users(session):
+    for user_id in session.info.pop('invalidate_users', ()):
+        invalidate_user(user_id)
+
+
+def _get_verify_executor():
+    """Пул проверки паролей процесса (None - проверять в потоке запроса); после fork создаётся заново"""
+    global _verify_executor, _verify_slots, _verify_pid
+    workers = current_app.config.get('PASSWORD_VERIFY_WORKERS', 0)
+    if not workers:
+        return None, None
+    if _verify_executor is None or _verify_pid != os.getpid():
+        with _user_cache_lock:
+            if _verify_executor is None or _verify_pid != os.getpid():
+                queue = current_app.config.get('PASSWORD_VERIFY_QUEUE', 16)
+                _verify_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-verify')
+                _verify_slots = threading.BoundedSemaphore(workers + queue)
+                _verify_pid = os.getpid()
+    return _verify_executor, _verify_slots
+
+
+def verify_password(user, password):
+    """Проверить пароль; при PASSWORD_VERIFY_WORKERS > 0 - в ограниченном пуле потоков.
+
+    Не больше PASSWORD_VERIFY_WORKERS хэшей считаются одновременно и не больше
+    PASSWORD_VERIFY_QUEUE ждут очереди; остальные получают PasswordCheckBusy сразу,
+    не занимая поток запроса.
+    """
+    executor, slots = _get_verify_executor()
+    if executor is None:
+        return user.check_password(password)
+    if not user.password_hash:
+        return False
+    if not slots.acquire(blocking=False):
+        raise PasswordCheckBusy("Too many concurrent logins")
+    try:
+        # В пул уходит только строка хэша: ORM-объект не трогается из чужого потока
+        return executor.submit(check_password_hash, user.password_hash, password).result()
+    finally:
+        slots.release()
+
+
+def authenticate(email, password):
+    """Вход по email и паролю. Хэш, посчитанный с устаревшими параметрами,
+    пересчитывается с текущими (PASSWORD_HASH_METHOD) при успешном входе."""
+    if not email or not password:
+        return None
+    user = User.query.filter_by(email=email).first()
+    if not user or not verify_password(user, password):
+        return None
+    if user.password_needs_rehash():
+        user.set_password(password)
+        db.session.commit()
+    return user
 
 
 def find_user_by_identifier(identifier):
@@ -37,7 +193,156 @@ def check_user_exists(email):
 
 def generate_ticket_number():
     """Сгенерировать уникальный номер читательского билета"""
-    while True:
-        ticket = ''.join(random.choices(string.digits, k=8))
-        if not User.query.filter_by(ticket_number=ticket).first():
-            return ticket
+    return allocate_ticket_numbers(1)[0]
+
+
+def allocate_ticket_numbers(count):
+    """Выделить count свободных номеров билетов: кандидаты генерируются пачкой
+    и сверяются с занятыми одним запросом на пачку, а не запросом на каждый номер"""
+    tickets = set()
+    while len(tickets) < count:
+        # С запасом на совпадения, чтобы почти всегда хватало одного раунда
+        needed = count - len(tickets)
+        candidates = set()
+        while len(candidates) < needed + needed // 10 + 1:
+            candidates.add(''.join(random.choices(string.digits, k=8)))
+        candidates -= tickets
+        taken = {
+            ticket for (ticket,) in
+            db.session.query(User.ticket_number).filter(User.ticket_number.in_(candidates))
+        }
+        tickets.update(list(candidates - taken)[:needed])
+    return list(tickets)
+
+
+READER_COLUMNS = ['email', 'full_name', 'ticket_number', 'password', 'status', 'error']
+
+
+def parse_readers_csv(text):
+    """Строки CSV с колонками email, full_name (заголовок обязателен); ValueError - битый CSV"""
+    try:
+        return [
+            {'email': row.get('email'), 'full_name': row.get('full_name')}
+            for row in csv.DictReader(io.StringIO(text))
+        ]
+    except csv.Error as e:
+        raise ValueError(f"Invalid CSV: {e}")
+
+
+def readers_to_csv(results):
+    """Результат импорта в CSV для выдачи читателям (с временными паролями)"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=READER_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(results)
+    return buffer.getvalue()
+
+
+def _validate_reader(row):
+    if not isinstance(row, dict):
+        return None, None, "Reader must be an object"
+    email = str(row.get('email') or '').strip()
+    full_name = str(row.get('full_name') or '').strip()
+    if not email or '@' not in email or len(email) > 120:
+        return email, full_name, "Invalid email"
+    if not full_name or len(full_name) > 100:
+        return email, full_name, "Full name is required (up to 100 characters)"
+    return email, full_name, None
+
+
+def _insert_readers(readers):
+    """Вставить пакет одной транзакцией; при конфликте (параллельная регистрация
+    или совпавший билет) - по одному, с новым билетом для каждого"""
+    try:
+        db.session.execute(insert(User), readers)
+        db.session.commit()
+        return [(reader, 'created', None) for reader in readers]
+    except IntegrityError:
+        db.session.rollback()
+
+    results = []
+    for reader in readers:
+        # Без учёта регистра - как и проверка существующих email в import_readers
+        if db.session.query(User.id).filter(
+            db.func.lower(User.email) == reader['email'].lower()
+        ).first() is not None:
+            results.append((reader, 'exists', "Email already registered"))
+            continue
+        reader['ticket_number'] = generate_ticket_number()
+        try:
+            db.session.execute(insert(User), [reader])
+            db.session.commit()
+            results.append((reader, 'created', None))
+        except IntegrityError:
+            db.session.rollback()
+            results.append((reader, 'error', "Could not insert reader"))
+    return results
+
+
+def import_readers(rows, batch_size=None, hash_workers=None):
+    """Массовая регистрация читателей.
+
+    Уже зарегистрированные email отсекаются одним запросом, номера билетов
+    выделяются пачками (allocate_ticket_numbers), временные пароли хэшируются
+    параллельно, читатели вставляются пакетами по batch_size в отдельных транзакциях.
+    Возвращает строки результата (с номерами билетов и временными паролями) и итоги.
+    """
+    batch_size = batch_size or current_app.config.get('READER_IMPORT_BATCH_SIZE', 500)
+    hash_workers = min(
+        hash_workers or current_app.config.get('READER_IMPORT_HASH_WORKERS', 2),
+        os.cpu_count() or 1
+    )
+    max_rows = current_app.config.get('BATCH_MAX_ROWS', 5000)
+    if len(rows) > max_rows:
+        raise ValueError(f"Import is limited to {max_rows} readers")
+
+    results = []
+    valid = {}
+    for row in rows:
+        email, full_name, error = _validate_reader(row)
+        if error:
+            results.append({'email': email, 'full_name': full_name, 'status': 'invalid', 'error': error})
+        elif email.lower() in valid:
+            results.append({'email': email, 'full_name': full_name, 'status': 'duplicate',
+                            'error': "Email repeated in input"})
+        else:
+            valid[email.lower()] = (email, full_name)
+
+    # Email сравниваются без учёта регистра - как и повторы во входных данных
+    existing = {
+        email for (email,) in db.session.query(db.func.lower(User.email)).filter(
+            db.func.lower(User.email).in_(list(valid))
+        )
+    } if valid else set()
+    for key in existing:
+        email, full_name = valid[key]
+        results.append({'email': email, 'full_name': full_name, 'status': 'exists',
+                        'error': "Email already registered"})
+    new_readers = [(email, full_name) for key, (email, full_name) in valid.items() if key not in existing]
+
+    method = password_hash_method()
+    with ThreadPoolExecutor(max_workers=hash_workers) as executor:
+        for start in range(0, len(new_readers), batch_size):
+            batch = new_readers[start:start + batch_size]
+            passwords = [''.join(random.choices(string.digits, k=6)) for _ in batch]
+            hashes = list(executor.map(lambda password: generate_password_hash(password, method), passwords))
+            tickets = allocate_ticket_numbers(len(batch))
+            readers = [
+                {'email': email, 'full_name': full_name, 'role': 'user',
+                 'ticket_number': ticket, 'password_hash': password_hash}
+                for (email, full_name), ticket, password_hash in zip(batch, tickets, hashes)
+            ]
+            password_by_email = dict(zip((email for email, _ in batch), passwords))
+            for reader, status, error in _insert_readers(readers):
+                result = {'email': reader['email'], 'full_name': reader['full_name'], 'status': status}
+                if status == 'created':
+                    result['ticket_number'] = reader['ticket_number']
+                    result['password'] = password_by_email[reader['email']]
+                if error:
+                    result['error'] = error
+                results.append(result)
+
+    summary = {'total': len(rows)}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return {'readers': results, 'summary': summary}
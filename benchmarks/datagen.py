@@ -0,0 +1,127 @@
+"""Детерминированный генератор тестового набора данных для бенчмарков.
+
+Одинаковые параметры и seed дают одинаковые книги, авторов, жанры, читателей
+и историю выдач; даты отсчитываются от today, чтобы брони не оказались просроченными.
+"""
+import random
+from datetime import date, timedelta
+from sqlalchemy import insert, select, update
+from werkzeug.security import generate_password_hash
+from app.models import db, Author, Book, BorrowRecord, Genre, User, book_authors, book_genres
+
+SYLLABLES = ['ка', 'ро', 'ми', 'ла', 'то', 'не', 'ва', 'со', 'ри', 'да', 'по', 'лу', 'ше', 'га', 'ти', 'мо']
+BENCH_EMAIL_DOMAIN = 'bench.local'
+BENCH_PASSWORD = 'benchmark'
+CHUNK_SIZE = 5000
+
+# Доли статусов в истории выдач
+STATUS_WEIGHTS = {'returned': 70, 'issued': 15, 'reserved': 10, 'cancelled': 5}
+
+
+def _word(rng, syllables=3):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(syllables))
+
+
+def _insert_chunked(table, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(insert(table), rows[start:start + CHUNK_SIZE])
+
+
+def book_isbn(index):
+    return f"978{index:010d}"
+
+
+def generate(books=5000, authors=1000, genres=30, users=2000, records=50000, seed=42, today=None):
+    """Заполнить пустую базу; возвращает параметры набора для отчёта"""
+    rng = random.Random(seed)
+    today = today or date.today()
+
+    # Имена авторов уникальны (индекс uq_authors_name)
+    author_names = {}
+    while len(author_names) < authors:
+        author_names.setdefault(f"{_word(rng).capitalize()} {_word(rng, 4).capitalize()}"[:50])
+    genre_names = [f"{_word(rng, 2).capitalize()} {index}"[:30] for index in range(genres)]
+    _insert_chunked(Author, [{'name': name} for name in author_names])
+    _insert_chunked(Genre, [{'name': name} for name in genre_names])
+    author_ids = db.session.scalars(select(Author.id).order_by(Author.id)).all()
+    genre_ids = db.session.scalars(select(Genre.id).order_by(Genre.id)).all()
+
+    book_rows, author_links, genre_links = [], [], []
+    for index in range(books):
+        isbn = book_isbn(index)
+        title = ' '.join(_word(rng, rng.randint(2, 4)) for _ in range(rng.randint(1, 3)))
+        book_rows.append({'isbn': isbn, 'title': title[:30].capitalize(), 'copies_available': rng.randint(0, 5)})
+        for author_id in rng.sample(author_ids, rng.randint(1, 3)):
+            author_links.append({'book_isbn': isbn, 'author_id': author_id})
+        for genre_id in rng.sample(genre_ids, rng.randint(1, 2)):
+            genre_links.append({'book_isbn': isbn, 'genre_id': genre_id})
+    _insert_chunked(Book, book_rows)
+    _insert_chunked(book_authors, author_links)
+    _insert_chunked(book_genres, genre_links)
+
+    # Один хэш на всех: генерация не должна упираться в хэширование паролей
+    password_hash = generate_password_hash(BENCH_PASSWORD, 'pbkdf2:sha256:1000')
+    _insert_chunked(User, [{
+        'email': f"reader{index}@{BENCH_EMAIL_DOMAIN}",
+        'full_name': f"{_word(rng).capitalize()} {_word(rng, 4).capitalize()}",
+        'ticket_number': f"{index:08d}",
+        'password_hash': password_hash,
+        'role': 'user',
+        'created_at': today - timedelta(days=rng.randint(0, 730)),
+        'is_active': True
+    } for index in range(users)])
+    user_ids = db.session.scalars(
+        select(User.id).where(User.email.like(f"%@{BENCH_EMAIL_DOMAIN}")).order_by(User.id)
+    ).all()
+
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+    record_rows = []
+    for _ in range(records):
+        status = rng.choices(statuses, weights)[0]
+        if status == 'reserved':
+            borrow_date = today - timedelta(days=rng.randint(0, 2))
+        else:
+            borrow_date = today - timedelta(days=rng.randint(3, 730))
+        issue_date = borrow_date + timedelta(days=rng.randint(0, 2)) if status in ('issued', 'returned') else None
+        record_rows.append({
+            'book_isbn': book_isbn(rng.randrange(books)),
+            'user_id': rng.choice(user_ids),
+            'borrow_date': borrow_date,
+            'reservation_expiry': borrow_date + timedelta(days=3) if status == 'reserved' else None,
+            'issue_date': issue_date,
+            'return_date': issue_date + timedelta(days=rng.randint(1, 30)) if status == 'returned' else None,
+            'status': status
+        })
+    _insert_chunked(BorrowRecord, record_rows)
+    db.session.commit()
+
+    return {'books': books, 'authors': authors, 'genres': genres, 'users': users, 'records': records,
+            'seed': seed, 'today': today.isoformat()}
+
+
+def add_expired_reservations(count, seed=0, today=None):
+    """Добавить count просроченных броней (с уменьшением числа копий) для замера отмены"""
+    rng = random.Random(seed)
+    today = today or date.today()
+    isbns = db.session.scalars(
+        select(Book.isbn).where(Book.copies_available > 0).order_by(Book.isbn).limit(count)
+    ).all()
+    user_ids = db.session.scalars(
+        select(User.id).where(User.email.like(f"%@{BENCH_EMAIL_DOMAIN}")).order_by(User.id).limit(1000)
+    ).all()
+    _insert_chunked(BorrowRecord, [{
+        'book_isbn': isbn,
+        'user_id': rng.choice(user_ids),
+        'borrow_date': today - timedelta(days=10),
+        'reservation_expiry': today - timedelta(days=rng.randint(1, 7)),
+        'status': 'reserved'
+    } for isbn in isbns])
+    db.session.execute(
+        update(Book)
+        .where(Book.isbn.in_(isbns))
+        .values(copies_available=Book.copies_available - 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return len(isbns)
@@ -0,0 +1,247 @@
+"""Бенчмарки сервисного слоя на синтетических данных.
+
+Запускать против отдельной локальной базы - набор данных записывается в неё:
+
+    DB_NAME=library_bench python -m benchmarks.run --output baseline.json
+    DB_NAME=library_bench python -m benchmarks.run --reuse --baseline baseline.json --fail-on-regression
+
+Результат - JSON (min/median/mean/p95 в миллисекундах на каждую функцию). С --baseline
+для каждой функции выводится изменение медианы; изменение больше --tolerance
+считается регрессией (или ускорением).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, select, update
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--authors', type=int, default=1000)
+    parser.add_argument('--genres', type=int, default=30)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reuse', action='store_true', help='Использовать уже сгенерированные данные')
+    parser.add_argument('--repeat', type=int, default=10, help='Замеров на функцию')
+    parser.add_argument('--warmup', type=int, default=2, help='Прогревочных вызовов (не учитываются)')
+    parser.add_argument('--only', action='append', default=[], help='Запустить только эти бенчмарки')
+    parser.add_argument('--with-cache', action='store_true',
+                        help='Не выключать кэш каталога (по умолчанию меряются запросы к БД)')
+    parser.add_argument('--output', help='Файл для JSON-результата (по умолчанию stdout)')
+    parser.add_argument('--baseline', help='JSON предыдущего прогона для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Допустимое изменение медианы (доля)')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Код выхода 1 при регрессии')
+    return parser.parse_args(argv)
+
+
+def build_app(args):
+    # Фоновые задачи и кэши процесса исказили бы замеры
+    os.environ['EXPIRY_SWEEP_INTERVAL'] = '0'
+    os.environ['GOOGLE_BOOKS_CACHE_PURGE_INTERVAL'] = '0'
+    os.environ['STATS_CACHE_TTL'] = '0'
+    if not args.with_cache:
+        os.environ['CATALOG_CACHE_SIZE'] = '0'
+
+    from app import create_app, database_uri
+    from app.db.migrate import upgrade
+
+    engine = create_engine(database_uri())
+    try:
+        upgrade(engine, log=lambda message: print(message, file=sys.stderr))
+    finally:
+        engine.dispose()
+    return create_app()
+
+
+def summarize(times):
+    ordered = sorted(times)
+    return {
+        'runs': len(ordered),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'median_ms': round(statistics.median(ordered) * 1000, 3),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3)
+    }
+
+
+class Runner:
+    def __init__(self, args):
+        self.args = args
+        self.results = {}
+
+    def enabled(self, name):
+        return not self.args.only or name in self.args.only
+
+    def measure(self, name, func, setup=None, force=False):
+        """Замер func(*setup()); setup и очистка сессии в время не входят"""
+        from app.models import db
+
+        if not force and not self.enabled(name):
+            return
+        times = []
+        for iteration in range(self.args.warmup + self.args.repeat):
+            call_args = setup(iteration) if setup else ()
+            started = time.perf_counter()
+            func(*call_args)
+            elapsed = time.perf_counter() - started
+            db.session.remove()
+            if iteration >= self.args.warmup:
+                times.append(elapsed)
+        self.results[name] = summarize(times)
+        print(f"{name}: median {self.results[name]['median_ms']} ms", file=sys.stderr)
+
+
+def run_benchmarks(runner):
+    from app.models import db, Book, BorrowRecord, User
+    from app.services import library_service
+    from benchmarks import datagen
+
+    user_id = db.session.scalars(
+        select(BorrowRecord.user_id).group_by(BorrowRecord.user_id)
+        .order_by(db.func.count().desc(), BorrowRecord.user_id).limit(1)
+    ).first() or db.session.scalars(select(User.id).order_by(User.id).limit(1)).first()
+    query = db.session.scalars(select(Book.title).order_by(Book.isbn).limit(1)).first()[:4].lower()
+    circulation_isbn = datagen.book_isbn(0)
+    db.session.remove()
+
+    runner.measure('get_books', library_service.get_books)
+    runner.measure('search_books_all', lambda: library_service.search_books('', 'all'))
+    runner.measure('search_books_query', lambda: library_service.search_books(query, 'all'))
+    runner.measure('search_books_page', lambda: library_service.search_books_page(query, 'available'))
+    runner.measure('get_all_records', library_service.get_all_records)
+    if runner.enabled('filter_records'):
+        all_records = library_service.get_all_records()
+        runner.measure('filter_records', lambda: library_service.filter_records(all_records, 'issued', 'reader1', ''))
+    runner.measure('get_borrow_history', lambda: library_service.get_borrow_history(user_id=user_id))
+    runner.measure('get_active_borrows', lambda: library_service.get_active_borrows(user_id))
+    runner.measure('prepare_profile_data', lambda: library_service.prepare_profile_data(user_id))
+
+    # Цикл выдачи на одной книге с запасом экземпляров: бронь -> выдача -> возврат.
+    # Три замера зависят друг от друга, поэтому запускаются только вместе
+    if any(runner.enabled(name) for name in ('reserve_book', 'issue_book', 'return_book')):
+        db.session.execute(
+            update(Book).where(Book.isbn == circulation_isbn)
+            .values(copies_available=runner.args.warmup + runner.args.repeat + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        reserved = []
+        runner.measure('reserve_book', lambda: reserved.append(library_service.reserve_book(circulation_isbn, user_id)),
+                       force=True)
+        runner.measure('issue_book', library_service.issue_book, setup=lambda iteration: (reserved.pop(),), force=True)
+        runner.measure('return_book', lambda: library_service.return_book(circulation_isbn, user_id), force=True)
+
+    def add_expired(iteration):
+        datagen.add_expired_reservations(200, seed=iteration)
+        return ()
+
+    runner.measure(
+        'cancel_expired_reservations',
+        lambda: library_service.cancel_expired_reservations(batch_size=500),
+        setup=add_expired
+    )
+
+
+def compare(results, baseline, tolerance):
+    """Сравнение медиан с прошлым прогоном: {имя: {baseline_ms, current_ms, change, verdict}}"""
+    comparison = {}
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            comparison[name] = {'verdict': 'new'}
+            continue
+        change = current['median_ms'] / previous['median_ms'] - 1 if previous['median_ms'] else 0.0
+        if change > tolerance:
+            verdict = 'regression'
+        elif change < -tolerance:
+            verdict = 'improvement'
+        else:
+            verdict = 'unchanged'
+        comparison[name] = {
+            'baseline_ms': previous['median_ms'],
+            'current_ms': current['median_ms'],
+            'change': round(change, 4),
+            'verdict': verdict
+        }
+    return comparison
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv):
+    args = parse_args(argv)
+    app = build_app(args)
+
+    with app.app_context():
+        from app.models import db, Book
+        from benchmarks import datagen
+
+        has_data = db.session.scalars(select(Book.isbn).limit(1)).first() is not None
+        if has_data and not args.reuse:
+            print("Database is not empty: point DB_NAME to an empty benchmark database "
+                  "or pass --reuse to benchmark the existing data", file=sys.stderr)
+            return 2
+        if not has_data:
+            started = time.perf_counter()
+            datagen.generate(args.books, args.authors, args.genres, args.users, args.records, args.seed)
+            print(f"Generated dataset in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        runner = Runner(args)
+        run_benchmarks(runner)
+
+    report = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'machine': platform.platform(),
+            'dataset': {key: getattr(args, key) for key in ('books', 'authors', 'genres', 'users', 'records', 'seed')},
+            'reused_data': has_data,
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+            'catalog_cache': args.with_cache
+        },
+        'results': runner.results
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['comparison'] = compare(runner.results, json.load(f), args.tolerance)
+        for name, row in report['comparison'].items():
+            if row['verdict'] != 'new':
+                print(f"{name}: {row['baseline_ms']} -> {row['current_ms']} ms ({row['change']:+.1%}) {row['verdict']}",
+                      file=sys.stderr)
+            if row['verdict'] == 'regression':
+                regressions.append(name)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if regressions and args.fail_on_regression:
+        print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,36 @@
+"""Настройки gunicorn для production-запуска: gunicorn -c gunicorn.conf.py wsgi:app
+
+Приложение загружается один раз в мастере (preload) и разделяется с воркерами
+через fork; соединения с БД и фоновые задачи каждый воркер создаёт сам в post_fork.
+kill -HUP <pid мастера> плавно перезапускает воркеры, но приложение остаётся тем,
+что загружено в мастере: новый код подхватывается только полным перезапуском
+gunicorn (или по HUP при GUNICORN_PRELOAD=0).
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+# Число процессов-воркеров (по умолчанию 2 * ядра + 1)
+workers = int(os.getenv('GUNICORN_WORKERS', str(multiprocessing.cpu_count() * 2 + 1)))
+# Потоков на воркер; больше 1 - воркеры gthread
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+# Сколько секунд держать keep-alive соединение между запросами
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+# Зависший дольше timeout воркер перезапускается
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+# Сколько воркер дописывает начатые запросы при перезапуске/остановке
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+# Перезапуск воркера после N запросов (0 - никогда), с разбросом, чтобы не все сразу
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+# Загрузка приложения в мастере до fork; при 0 каждый воркер загружает его сам (и HUP подхватывает новый код)
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    from app import init_worker
+    init_worker(server.app.wsgi())
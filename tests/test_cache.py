@@ -0,0 +1,138 @@
+"""Кэши процесса и дисковый кэш Google Books"""
+import sqlite3
+import threading
+import pytest
+from app.cache import SingleFlight, SQLiteCache, TTLCache, VersionedCache
+from app.services import google_books_service
+
+
+def test_sqlite_cache_writes_batch_and_purges(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite3'))
+    cache.set_many([('a', {'title': 'A'}, 60), ('b', [], 60), ('gone', None, -1)])
+
+    assert cache.get_with_expiry('a')[0] == {'title': 'A'}
+    assert cache.get_with_expiry('b')[0] == []
+    assert cache.get_with_expiry('gone') is None
+    assert cache.purge_expired() == 1
+    with sqlite3.connect(cache.path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+
+class BrokenDiskCache:
+    path = 'broken'
+
+    def get_with_expiry(self, key):
+        raise sqlite3.OperationalError("database is locked")
+
+    def set_many(self, entries):
+        raise sqlite3.OperationalError("disk I/O error")
+
+
+@pytest.fixture
+def broken_disk_cache(app, monkeypatch):
+    monkeypatch.setattr(google_books_service, '_memory_cache', TTLCache(maxsize=10, ttl=60))
+    monkeypatch.setattr(google_books_service, '_disk_cache', BrokenDiskCache())
+
+
+def test_disk_cache_errors_are_misses(broken_disk_cache):
+    assert google_books_service._cache_get('isbn:1') is google_books_service._MISSING
+
+    google_books_service._cache_set('isbn:1', {'isbn': '1'})
+    assert google_books_service._cache_get('isbn:1') == {'isbn': '1'}
+
+
+def test_isbn_key_ignores_hyphens_and_spaces():
+    keys = {google_books_service._isbn_key(isbn) for isbn in ['978-5-17-090138-5', ' 978 5170901385 ', '9785170901385']}
+    assert keys == {'isbn:9785170901385'}
+
+
+def run_concurrently(threads, target):
+    barrier = threading.Barrier(threads)
+    results = [None] * threads
+
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = target()
+        except Exception as e:
+            results[index] = e
+
+    pool = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return results
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def upstream():
+        calls.append(1)
+        release.wait(5)
+        return {'title': 'Book'}
+
+    def call():
+        return flight.do('isbn:1', upstream)
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    results = run_concurrently(8, call)
+    timer.join()
+
+    assert len(calls) == 1
+    assert results == [{'title': 'Book'}] * 8
+    assert flight.stats()['shared'] == 7 and flight.stats()['in_flight'] == 0
+
+
+def test_single_flight_passes_error_to_all_waiters():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def upstream():
+        calls.append(1)
+        release.wait(5)
+        raise google_books_service.GoogleBooksUnavailable("circuit is open")
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    results = run_concurrently(8, lambda: flight.do('isbn:1', upstream))
+    timer.join()
+
+    assert len(calls) == 1
+    assert all(isinstance(result, google_books_service.GoogleBooksUnavailable) for result in results)
+
+
+def test_versioned_cache_drops_value_loaded_across_a_version_bump():
+    version = [1]
+    cache = VersionedCache(lambda: version[0], poll_interval=0)
+    loads = []
+
+    def stale_loader():
+        # Пока идёт загрузка, другой воркер меняет данные, и соседний запрос видит новую версию
+        loads.append('stale')
+        version[0] = 2
+        assert cache.get_or_load('other', lambda: 'other') == 'other'
+        return 'stale'
+
+    assert cache.get_or_load('books', stale_loader) == 'stale'
+    assert cache.generation == 1
+
+    assert cache.get_or_load('books', lambda: loads.append('fresh') or 'fresh') == 'fresh'
+    assert loads == ['stale', 'fresh']
+    assert cache.get_or_load('books', lambda: 'unused') == 'fresh'
+
+
+def test_versioned_cache_drops_value_loaded_across_a_local_clear():
+    cache = VersionedCache(lambda: 1, poll_interval=60)
+
+    def loader():
+        cache.clear()
+        return 'stale'
+
+    assert cache.get_or_load('books', loader) == 'stale'
+    assert cache.get_or_load('books', lambda: 'fresh') == 'fresh'
@@ -0,0 +1,83 @@
+"""Атомарность переходов выдачи: условные UPDATE не дают выдать больше копий, чем есть"""
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import text
+from app.db import db as db_module
+from app.models import db, Book, User
+from tests.conftest import requires_postgres
+
+
+@pytest.fixture
+def reader_and_book(app):
+    user = User(email='reader@example.com', full_name='Reader', role='user', password_hash='-')
+    db.session.add_all([user, Book(isbn='9780000000001', title='Book', copies_available=2)])
+    db.session.commit()
+    return user.id, '9780000000001'
+
+
+def copies(isbn):
+    db.session.expire_all()
+    return db.session.get(Book, isbn).copies_available
+
+
+def test_reserve_stops_at_zero_copies(reader_and_book):
+    user_id, isbn = reader_and_book
+    db_module.reserve_book(isbn, user_id)
+    db_module.reserve_book(isbn, user_id)
+    with pytest.raises(ValueError, match="No copies available"):
+        db_module.reserve_book(isbn, user_id)
+    assert copies(isbn) == 0
+
+
+def test_transitions_apply_once(reader_and_book):
+    user_id, isbn = reader_and_book
+    record_id = db_module.reserve_book(isbn, user_id)
+    assert db_module.issue_book(record_id) == (isbn, user_id)
+    with pytest.raises(ValueError, match="not in reserved status"):
+        db_module.issue_book(record_id)
+
+    db_module.cancel_reservation(record_id)
+    with pytest.raises(ValueError, match="Cannot cancel"):
+        db_module.cancel_reservation(record_id)
+    with pytest.raises(ValueError, match="No active issued record"):
+        db_module.return_book(isbn, user_id)
+    assert copies(isbn) == 2
+
+
+@requires_postgres
+def test_concurrent_circulation_keeps_copy_counts(app):
+    """Та же проверка, что flask stress-circulation: параллельные брони одной книги
+    не превышают число копий, после отмен и возвратов фонд восстанавливается"""
+    result = app.test_cli_runner().invoke(
+        args=['stress-circulation', '--copies', '20', '--threads', '8', '--attempts', '5']
+    )
+    assert result.exit_code == 0, result.output
+    assert "OK: no oversold copies" in result.output
+
+
+@requires_postgres
+def test_sweep_cancels_expired_reservations(reader_and_book):
+    from app.services import library_service
+
+    user_id, isbn = reader_and_book
+    record_id = db_module.reserve_book(isbn, user_id)
+    db.session.execute(
+        text("UPDATE borrow_records SET reservation_expiry = :expiry WHERE id = :id"),
+        {'expiry': date.today() - timedelta(days=1), 'id': record_id}
+    )
+    db.session.commit()
+
+    report = library_service.cancel_expired_reservations(batch_size=10)
+    assert (report['records'], report['books'], report['locked']) == (1, 1, False)
+    assert copies(isbn) == 2
+
+
+@requires_postgres
+def test_sweep_skips_while_another_holds_the_lock(reader_and_book):
+    from app.services import library_service
+
+    with db.engine.connect() as other:
+        other.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': db_module.EXPIRY_SWEEP_LOCK_KEY})
+        report = library_service.cancel_expired_reservations(batch_size=10)
+        other.rollback()
+    assert report['locked'] and report['batches'] == 0
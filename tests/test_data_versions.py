@@ -0,0 +1,35 @@
+"""Версии данных для ETag и кэшей поднимаются в той же транзакции, что и запись"""
+import pytest
+from app.db import db as db_module
+from app.models import db, Book, User
+
+
+@pytest.fixture
+def reader_and_book(app):
+    user = User(email='reader@example.com', full_name='Reader', role='user', password_hash='-')
+    db.session.add_all([user, Book(isbn='9780000000001', title='Book', copies_available=1)])
+    db.session.commit()
+    return user.id, '9780000000001'
+
+
+def versions(user_id):
+    return db_module.get_data_version(db_module.CATALOG_SCOPE), db_module.get_data_version(db_module.user_scope(user_id))
+
+
+def test_write_bumps_catalog_and_reader_versions(reader_and_book):
+    user_id, isbn = reader_and_book
+    catalog_before, _ = versions(user_id)
+    record_id = db_module.reserve_book(isbn, user_id)
+    assert versions(user_id) == (catalog_before + 1, 1)
+    db_module.issue_book(record_id)
+    assert versions(user_id) == (catalog_before + 2, 2)
+
+
+def test_rejected_write_does_not_bump(reader_and_book):
+    user_id, isbn = reader_and_book
+    db_module.reserve_book(isbn, user_id)
+    before = versions(user_id)
+    with pytest.raises(ValueError):
+        db_module.reserve_book(isbn, user_id)
+    db.session.commit()
+    assert versions(user_id) == before
@@ -0,0 +1,32 @@
+"""ETag ответов API с записями выдачи: меняется и при записи выдачи, и при правке каталога"""
+import pytest
+from app.db import db as db_module
+from app.models import db, Book
+from app.services import library_service
+
+
+@pytest.fixture
+def reservation(admin_client):
+    db.session.add(Book(isbn='9780000000001', title='Old title', copies_available=1))
+    db.session.commit()
+    db_module.reserve_book('9780000000001', admin_client.admin_id)
+    return '9780000000001'
+
+
+@pytest.mark.parametrize('path, key', [
+    ('/api/v1/borrow-history', 'history'),
+    ('/api/v1/active-borrows', 'active_borrows'),
+])
+def test_book_rename_invalidates_borrow_etag(admin_client, reservation, path, key):
+    first = admin_client.get(path)
+    assert first.status_code == 200
+    assert first.get_json()[key][0]['book_title'] == 'Old title'
+
+    unchanged = admin_client.get(path, headers={'If-None-Match': first.headers['ETag']})
+    assert unchanged.status_code == 304
+
+    library_service.update_book(reservation, 'New title', 1)
+    renamed = admin_client.get(path, headers={'If-None-Match': first.headers['ETag']})
+    assert renamed.status_code == 200
+    assert renamed.get_json()[key][0]['book_title'] == 'New title'
+    assert renamed.headers['ETag'] != first.headers['ETag']
@@ -0,0 +1,119 @@
+"""HttpClient против локальной заглушки http.server: повторы, таймаут, выключатель"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from app.services.http_client import CircuitOpenError, HttpClient
+
+
+class StubServer(ThreadingHTTPServer):
+    """Отвечает по сценарию: список (статус, задержка в секундах), последний ответ повторяется"""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.script = [(200, 0)]
+        self.request_times = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/volumes"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.request_times.append(time.monotonic())
+        status, delay = server.script.pop(0) if len(server.script) > 1 else server.script[0]
+        time.sleep(delay)
+        body = json.dumps({'status': status}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_retries_503_with_backoff(stub):
+    stub.script = [(503, 0), (503, 0), (503, 0), (200, 0)]
+    client = HttpClient(stub.url, retries=3, backoff_factor=0.05)
+
+    assert client.get_json() == {'status': 200}
+    assert len(stub.request_times) == 4
+    # urllib3: первый повтор сразу, дальше backoff_factor * 2 ** (n - 1): 0.1 и 0.2 с
+    gaps = [later - earlier for earlier, later in zip(stub.request_times, stub.request_times[1:])]
+    assert gaps[1] >= 0.09 and gaps[2] >= 0.19
+    assert client.breaker.state == 'closed'
+
+
+def test_gives_up_after_retries(stub):
+    stub.script = [(503, 0)]
+    client = HttpClient(stub.url, retries=2, backoff_factor=0)
+
+    with pytest.raises(requests.HTTPError):
+        client.get_json()
+    assert len(stub.request_times) == 3
+
+
+def test_timeout(stub):
+    stub.script = [(200, 0.5)]
+    client = HttpClient(stub.url, timeout=0.1, retries=1, backoff_factor=0)
+
+    started = time.monotonic()
+    # Исчерпанные повторы urllib3 отдаёт как ConnectionError с ReadTimeoutError внутри
+    with pytest.raises(requests.RequestException, match='Read timed out'):
+        client.get_json()
+    assert time.monotonic() - started < 0.4
+    assert len(stub.request_times) == 2
+    assert client.breaker.failures == 1
+
+
+def test_breaker_opens_and_fails_fast(stub):
+    stub.script = [(503, 0)]
+    client = HttpClient(stub.url, retries=0, failure_threshold=2, reset_timeout=30)
+
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.get_json()
+    assert client.breaker.state == 'open'
+
+    with pytest.raises(CircuitOpenError):
+        client.get_json()
+    assert len(stub.request_times) == 2
+
+
+def test_breaker_half_open_recovers(stub):
+    stub.script = [(503, 0), (503, 0), (503, 0), (200, 0)]
+    client = HttpClient(stub.url, retries=0, failure_threshold=2, reset_timeout=0.1)
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.get_json()
+
+    time.sleep(0.15)
+    assert client.breaker.state == 'half-open'
+    # Неудачная проба снова открывает выключатель на reset_timeout
+    with pytest.raises(requests.HTTPError):
+        client.get_json()
+    assert client.breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        client.get_json()
+
+    time.sleep(0.15)
+    assert client.get_json() == {'status': 200}
+    assert client.breaker.state == 'closed'
+    assert len(stub.request_times) == 4
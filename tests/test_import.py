@@ -0,0 +1,66 @@
+"""Пакетный импорт из Google Books: форма запроса проверяется до начала потока"""
+import io
+import json
+import pytest
+from app.models import db, Author, Book, Genre
+from app.services import google_books_service, import_service
+
+URL = '/api/v1/import/google-books/batch'
+
+
+@pytest.fixture
+def google_books(monkeypatch):
+    def get_book_by_isbn(isbn, timeout=None):
+        return {'isbn': isbn, 'title': f"Book {isbn}", 'authors': ['Author'], 'categories': []}
+
+    monkeypatch.setattr(google_books_service, 'get_book_by_isbn', get_book_by_isbn)
+
+
+def statuses(response):
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return {line['isbn']: line['status'] for line in lines if 'isbn' in line}
+
+
+@pytest.mark.parametrize('body', [
+    ['9780000000001', '9780000000002'],
+    {'items': ['9780000000001', {'isbn': '9780000000002', 'copies': 2}]},
+    {'isbns': ['9780000000001', '9780000000002']},
+])
+def test_accepts_plain_isbns(admin_client, google_books, body):
+    response = admin_client.post(URL, json=body)
+    assert response.status_code == 200
+    assert statuses(response) == {'9780000000001': 'imported', '9780000000002': 'imported'}
+
+
+@pytest.mark.parametrize('body', [{'items': [['9780000000001']]}, {'items': 'x'}, '9780000000001'])
+def test_rejects_malformed_body(admin_client, google_books, body):
+    response = admin_client.post(URL, json=body)
+    assert response.status_code == 400
+
+
+def test_rejects_non_utf8_upload(admin_client, google_books):
+    response = admin_client.post(URL, data={'file': (io.BytesIO(b'\xff\xfe978'), 'isbns.txt')})
+    assert response.status_code == 400
+    assert 'UTF-8' in response.get_json()['error']
+
+
+def test_insert_reports_exists_only_for_duplicate_isbn(app):
+    db.session.add(Book(isbn='9780000000001', title='Old', copies_available=1))
+    db.session.commit()
+
+    results = import_service._insert_batch([
+        {'isbn': '9780000000001', 'title': 'Dup', 'copies': 1, 'authors': [], 'genres': []},
+        {'isbn': '9780000000002', 'title': None, 'copies': 1, 'authors': [], 'genres': []},
+    ])
+    assert [(isbn, status) for isbn, status, _ in results] == [
+        ('9780000000001', 'exists'), ('9780000000002', 'error')
+    ]
+
+
+def test_google_books_names_fit_columns():
+    book = google_books_service._book_from_volume(
+        {'title': 'T' * 100, 'authors': ['A' * 100], 'categories': ['G' * 100]}, '9780000000001'
+    )
+    assert len(book['title']) == Book.title.type.length
+    assert [len(name) for name in book['authors']] == [Author.name.type.length]
+    assert [len(name) for name in book['categories']] == [Genre.name.type.length]
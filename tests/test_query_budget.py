@@ -0,0 +1,83 @@
+"""Бюджеты SQL-запросов каталога и записей выдачи: число запросов не должно расти с каждой строкой.
+
+selectinload загружает связи пачками по 500 ключей, поэтому для каталога бюджет -
+1 + 2 * ceil(N / 500) запросов на N книг.
+"""
+import math
+import pytest
+from app.db.query_counter import QueryBudgetExceeded, max_queries
+from app.models import db, Author, Book, Genre
+from app.services import library_service
+
+CATALOG_BUDGETS = [
+    # книги + selectinload авторов + selectinload жанров
+    ('get_books', lambda: library_service.get_books(), 3),
+    ('search_books_all', lambda: library_service.search_books('', 'all'), 3),
+    ('search_books_query', lambda: library_service.search_books('book 1', 'available'), 3),
+    # + COUNT для count='exact'
+    ('search_books_page', lambda: library_service.search_books_page('', 'all', limit=5, count='exact'), 4),
+]
+
+
+@pytest.mark.parametrize('name, call, budget', CATALOG_BUDGETS, ids=[row[0] for row in CATALOG_BUDGETS])
+def test_catalog_query_budget(catalog, name, call, budget):
+    with max_queries(budget):
+        result = call()
+    books = result['items'] if isinstance(result, dict) else result
+    assert books
+    assert all(book['authors'] for book in books)
+
+
+def test_catalog_budget_grows_per_500_books(app):
+    author, genre = Author(name='Author'), Genre(name='Genre')
+    count = 1201
+    db.session.add_all([author, genre] + [
+        Book(isbn=f"978{index:010d}", title=f"Book {index}", copies_available=1, authors=[author], genres=[genre])
+        for index in range(count)
+    ])
+    db.session.commit()
+    db.session.remove()
+
+    with max_queries(1 + 2 * math.ceil(count / 500)):
+        books = library_service.get_books()
+    assert len(books) == count
+    assert all(book['authors'] == ['Author'] for book in books)
+
+
+@pytest.mark.parametrize('name, budget', [
+    ('get_borrow_history', 1),
+    ('get_active_borrows', 1),
+    ('get_pending_reservations', 1),
+    ('get_all_records', 1),
+])
+def test_borrow_records_query_budget(catalog, name, budget):
+    user_id = catalog['reader_ids'][0]
+    calls = {
+        'get_borrow_history': lambda: library_service.get_borrow_history(user_id=user_id),
+        'get_active_borrows': lambda: library_service.get_active_borrows(user_id),
+        'get_pending_reservations': library_service.get_pending_reservations,
+        'get_all_records': library_service.get_all_records,
+    }
+    with max_queries(budget):
+        records = calls[name]()
+    assert records
+    assert all(record['book_title'] for record in records)
+
+
+def test_records_page_query_budget(catalog):
+    with max_queries(1):
+        page = library_service.get_records_page(limit=10, status_filter='issued')
+    assert len(page['items']) == 10
+    assert page['next_cursor']
+
+
+def test_profile_query_budget(catalog):
+    with max_queries(3):
+        library_service.prepare_profile_data(catalog['reader_ids'][0])
+
+
+def test_budget_catches_n_plus_one(catalog):
+    with pytest.raises(QueryBudgetExceeded):
+        with max_queries(3):
+            for book in Book.query.all():
+                [author.name for author in book.authors]
@@ -0,0 +1,38 @@
+"""Массовая регистрация читателей"""
+from app.models import db, User
+from app.services import user_service
+
+
+def test_insert_fallback_matches_email_case_insensitively(app):
+    db.session.add(User(email='reader@example.com', full_name='Reader', role='user',
+                        ticket_number='00000001', password_hash='-'))
+    db.session.commit()
+
+    # Совпавший билет роняет пакет, и каждая строка вставляется заново по одной
+    results = user_service._insert_readers([
+        {'email': 'Reader@Example.com', 'full_name': 'Same reader', 'role': 'user',
+         'ticket_number': '00000002', 'password_hash': '-'},
+        {'email': 'new@example.com', 'full_name': 'New reader', 'role': 'user',
+         'ticket_number': '00000001', 'password_hash': '-'},
+    ])
+    assert [(reader['email'], status) for reader, status, _ in results] == [
+        ('Reader@Example.com', 'exists'), ('new@example.com', 'created')
+    ]
+    assert User.query.count() == 2
+
+
+def test_import_caps_hash_workers(app, monkeypatch):
+    pools = []
+
+    class RecordingExecutor(user_service.ThreadPoolExecutor):
+        def __init__(self, max_workers=None, **kwargs):
+            pools.append(max_workers)
+            super().__init__(max_workers=max_workers, **kwargs)
+
+    monkeypatch.setattr(user_service, 'ThreadPoolExecutor', RecordingExecutor)
+    monkeypatch.setattr(user_service.os, 'cpu_count', lambda: 64)
+    app.config['READER_IMPORT_HASH_WORKERS'] = 2
+
+    result = user_service.import_readers([{'email': 'a@example.com', 'full_name': 'A'}])
+    assert result['summary'] == {'total': 1, 'created': 1}
+    assert pools == [2]
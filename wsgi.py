@@ -0,0 +1,4 @@
+from app import create_app
+
+# Точка входа для gunicorn (см. gunicorn.conf.py); для локальной разработки - run.py
+app = create_app(prefork=True)